@@ -1,6 +1,8 @@
 import streamlit as st
 from datetime import datetime
 
+from utils.warmup import start_warm_up
+
 # -----------------------------------------------------------
 # Page Configuration
 # -----------------------------------------------------------
@@ -86,3 +88,10 @@ with col3:
 st.markdown("---")
 st.markdown("---")
 st.caption(f"Last updated: {datetime.now().strftime('%Y-%m-%d')} • Built with Streamlit 🌱")
+
+# -----------------------------------------------------------
+# Warm-up
+# -----------------------------------------------------------
+# Everything above is already drawn; load the dataset and chart templates in
+# the background so the Gallery and Dashboard open fast.
+start_warm_up()
@@ -1,7 +1,15 @@
 # pages/2_Charts_Gallery.py
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+
+from utils.charts import (
+    accidents_over_time_chart, location_map_chart, state_counts_chart, temperature_histogram_chart,
+)
+from utils.data import load_manifest, load_memory_report
+from utils.figures import payload_caption, show_chart
+from utils.memo import get_chart_cache, selection_key
+from utils.metrics import show_profile, start_profile
+from utils.query import POINT_COLUMNS, load_query
+from utils.snapshots import snapshot_slot
 
 # -----------------------------------------------------------
 # Page Title
@@ -11,11 +19,10 @@ st.title("📊 EDA Gallery — USA Accidents Sample")
 # -----------------------------------------------------------
 # Load Data
 # -----------------------------------------------------------
-@st.cache_data
-def load_data():
-    return pd.read_csv("data/accidents_small.csv")
-
-df = load_data()
+# Every chart is answered through the query API; only a partitioned dataset
+# is scanned per selection, the single-file sample stays in memory.
+manifest = load_manifest()
+query = load_query()
 
 # -----------------------------------------------------------
 # Data Source Documentation
@@ -24,9 +31,20 @@ st.info("📊 **Dataset Information**")
 col1, col2 = st.columns(2)
 
 with col1:
-    st.write(f"**Rows:** {len(df):,}")
-    st.write(f"**Columns:** {len(df.columns)}")
-    st.write(f"**Size:** {df.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
+    st.write(f"**Rows:** {manifest['rows']:,}")
+    if query.name == 'memory':
+        # Measured once per data version, not on every rerun
+        mem = load_memory_report(POINT_COLUMNS)
+        st.write(f"**Columns:** {len(manifest['columns'])} ({len(POINT_COLUMNS)} loaded)")
+        st.write(
+            f"**Size:** {mem['compact_bytes'] / 1024**2:.1f} MB "
+            f"(saved {mem['saved_bytes'] / 1024**2:.1f} MB vs. {mem['raw_bytes'] / 1024**2:.1f} MB with default dtypes)"
+        )
+    else:
+        st.write(f"**Columns:** {len(manifest['columns'])} ({len(POINT_COLUMNS)} read per selection)")
+    unparsed = manifest.get('timestamps', {}).get('Start_Time', {}).get('failures', 0)
+    if unparsed:
+        st.write(f"**Unparseable Start_Time values:** {unparsed:,} (kept, excluded from time-based charts)")
 
 with col2:
     st.write("**Source:** [Kaggle - US Accidents Dataset](https://www.kaggle.com/datasets/sobhanmoosavi/us-accidents)")
@@ -52,194 +70,209 @@ with st.expander("📋 Dataset Details & Methodology"):
     **Citation:** Moosavi, Sobhan, Mohammad Hossein Samavatian, Srinivasan Parthasarathy, 
     and Rajiv Ramnath. "A Countrywide Traffic Accident Dataset.", arXiv preprint 
     arXiv:1906.05409 (2019).
-    """.format(rows=len(df), columns=', '.join([f"`{col}`" for col in df.columns])))
+    """.format(rows=manifest['rows'], columns=', '.join([f"`{col}`" for col in manifest['columns']])))
 
 # -----------------------------------------------------------
 # Sidebar Filters
 # -----------------------------------------------------------
 st.sidebar.header("Filters")
 
-states = sorted(df['State'].dropna().unique())
-selected_states = st.sidebar.multiselect("Select States", states, default=states[:5])
-
-# Temperature range filter (since we have Temperature(F))
-temp_min = float(df['Temperature(F)'].min()) if not df['Temperature(F)'].isna().all() else 0
-temp_max = float(df['Temperature(F)'].max()) if not df['Temperature(F)'].isna().all() else 100
-selected_temp_range = st.sidebar.slider("Temperature Range (°F)", temp_min, temp_max, (temp_min, temp_max))
+# The filters and everything that depends on them run as one fragment: a
+# filter change reruns only this function (all four charts read both filters),
+# while the dataset information above and the ethics notes below stay as drawn.
+@st.fragment
+def filtered_charts():
+    # Stage timings for this rerun; only recorded with ?profile=1 or ACCIDENTS_PROFILE=1
+    profile = start_profile("gallery")
+    with profile.stage("load"):
+        query = load_query()
+        charts = get_chart_cache()
+
+    states = query.states
+    selected_states = st.sidebar.multiselect("Select States", states, default=states[:5])
+
+    # Temperature range filter (since we have Temperature(F))
+    temp_min = query.temp_min if query.temp_min is not None else 0
+    temp_max = query.temp_max if query.temp_max is not None else 100
+    selected_temp_range = st.sidebar.slider("Temperature Range (°F)", temp_min, temp_max, (temp_min, temp_max))
+
+    with profile.stage("filter"):
+        scan = query.scan_stats(selected_states, selected_temp_range)
+    if scan is not None:
+        st.sidebar.caption(
+            f"Read {scan['files']:,} of {scan['files_total']:,} partition files, "
+            f"{scan['row_groups']:,} of {scan['row_groups_total']:,} row groups"
+        )
 
-filtered_df = df[
-    (df['State'].isin(selected_states)) & 
-    (df['Temperature(F)'].between(selected_temp_range[0], selected_temp_range[1]))
-]
+    # Chart results are memoized per (data version of the selection, filter
+    # selection); an append only changes the version of the states it touched.
+    # Until a chart is computed its pre-rendered snapshot, if any, is shown in its place
+    key = selection_key(query, selected_states, selected_temp_range)
+    payload_bytes = {}
+
+    # -----------------------------------------------------------
+    # 1) Bar Chart — Accidents by State
+    # -----------------------------------------------------------
+    st.subheader("1) Accidents by State")
+    st.write("Question: Which states have the most accidents in the selected sample?")
+
+    def get_summary():
+        # Per-state and daily counts shared by charts 1 and 4
+        with profile.stage("summary") as timing:
+            summary = charts.get_or_compute(
+                ('gallery_summary', key), lambda: query.summary(selected_states, selected_temp_range)
+            )
+            timing["rows"] = summary.total
+        return summary
+
+    bar_slot = snapshot_slot('gallery_bar', key, charts)
+    with profile.stage("bar"):
+        fig_bar = charts.get_or_compute(
+            ('gallery_bar', key), lambda: state_counts_chart(get_summary(), horizontal=True, cache=charts)
+        )
 
-# -----------------------------------------------------------
-# 1) Bar Chart — Accidents by State
-# -----------------------------------------------------------
-st.subheader("1) Accidents by State")
-st.write("Question: Which states have the most accidents in the selected sample?")
-
-state_counts = filtered_df['State'].value_counts().reset_index()
-state_counts.columns = ['State', 'Count']
-
-fig_bar = px.bar(
-    state_counts,
-    x='Count',
-    y='State',
-    orientation='h',
-    text='Count',
-    labels={'Count': 'Number of Accidents', 'State': 'State'},
-    title='Accidents by State'
-)
-fig_bar.update_layout(yaxis={'categoryorder': 'total ascending'})
+    with profile.stage("bar render"):
+        show_chart('bar', fig_bar, payload_bytes, bar_slot)
 
-st.plotly_chart(fig_bar, use_container_width=True)
+    with st.expander("How to read this chart"):
+        st.write("""
+        - Y axis: State abbreviations  
+        - X axis: Number of accidents  
+        - Bars ordered by accident count  
+        - Hover to see exact numbers
+        """)
 
-with st.expander("How to read this chart"):
+    st.markdown("**Observations:**")
     st.write("""
-    - Y axis: State abbreviations  
-    - X axis: Number of accidents  
-    - Bars ordered by accident count  
-    - Hover to see exact numbers
+    - Some states have more recorded accidents than others.  
+    - Counts reflect the sample and reporting; interpret with caution.  
+    - Useful for identifying high-accident regions in this dataset.
     """)
 
-st.markdown("**Observations:**")
-st.write("""
-- Some states have more recorded accidents than others.  
-- Counts reflect the sample and reporting; interpret with caution.  
-- Useful for identifying high-accident regions in this dataset.
-""")
-
-st.markdown("---")
-
-# -----------------------------------------------------------
-# 2) Histogram — Temperature Distribution
-# -----------------------------------------------------------
-st.subheader("2) Temperature Distribution")
-st.write("Question: How are accident temperatures distributed?")
-
-fig_hist = px.histogram(
-    filtered_df.dropna(subset=['Temperature(F)']),
-    x='Temperature(F)',
-    nbins=30,
-    labels={'Temperature(F)': 'Temperature (°F)'},
-    title='Temperature Distribution of Accidents'
-)
-st.plotly_chart(fig_hist, use_container_width=True)
-
-with st.expander("How to read this chart"):
+    st.markdown("---")
+
+    # -----------------------------------------------------------
+    # 2) Histogram — Temperature Distribution
+    # -----------------------------------------------------------
+    st.subheader("2) Temperature Distribution")
+    st.write("Question: How are accident temperatures distributed?")
+
+    # Bins are counted server-side on fixed edges; the figure only carries one
+    # bar per bin instead of every temperature value.
+    hist_slot = snapshot_slot('gallery_hist', key, charts)
+    with profile.stage("histogram"):
+        fig_hist = charts.get_or_compute(
+            ('gallery_hist', key),
+            lambda: temperature_histogram_chart(query, selected_states, selected_temp_range, cache=charts)
+        )
+    with profile.stage("histogram render"):
+        show_chart('histogram', fig_hist, payload_bytes, hist_slot)
+
+    with st.expander("How to read this chart"):
+        st.write("""
+        - X axis: Temperature in Fahrenheit  
+        - Y axis: Number of accidents  
+        - Shows the distribution of temperatures when accidents occurred  
+        - Filter selections in the sidebar affect this chart
+        """)
+
+    st.markdown("**Observations:**")
     st.write("""
-    - X axis: Temperature in Fahrenheit  
-    - Y axis: Number of accidents  
-    - Shows the distribution of temperatures when accidents occurred  
-    - Filter selections in the sidebar affect this chart
+    - Most accidents occur in moderate temperature ranges.  
+    - Extreme temperatures (very hot or cold) may have fewer accidents.  
+    - Temperature filtering affects the distribution shape.
     """)
 
-st.markdown("**Observations:**")
-st.write("""
-- Most accidents occur in moderate temperature ranges.  
-- Extreme temperatures (very hot or cold) may have fewer accidents.  
-- Temperature filtering affects the distribution shape.
-""")
+    st.markdown("---")
 
-st.markdown("---")
+    # -----------------------------------------------------------
+    # 3) Scatter Plot — Location Map
+    # -----------------------------------------------------------
+    st.subheader("3) Accidents by Location")
+    st.write("Question: Where do accidents occur geographically?")
 
-# -----------------------------------------------------------
-# 3) Scatter Plot — Location Map
-# -----------------------------------------------------------
-st.subheader("3) Accidents by Location")
-st.write("Question: Where do accidents occur geographically?")
-
-# Sample data for performance if too many points
-map_df = filtered_df.dropna(subset=['Start_Lat', 'Start_Lng'])
-if len(map_df) > 1000:
-    map_df = map_df.sample(n=1000, random_state=42)
-
-fig_map = px.scatter_mapbox(
-    map_df,
-    lat='Start_Lat',
-    lon='Start_Lng',
-    color='Temperature(F)',
-    hover_data=['City', 'State', 'Start_Time', 'Temperature(F)'],
-    color_continuous_scale=px.colors.sequential.Viridis,
-    size_max=15,
-    zoom=3,
-    title='Accident Locations (Sample)',
-    labels={'Temperature(F)': 'Temperature (°F)'}
-)
+    # Few enough points are shown individually with their details; larger
+    # selections become grid cells sized by count and colored by mean temperature.
+    map_slot = snapshot_slot('gallery_map', key, charts)
+    with profile.stage("map"):
+        fig_map, map_caption = charts.get_or_compute(
+            ('gallery_map', key), lambda: location_map_chart(query, selected_states, selected_temp_range, cache=charts)
+        )
 
-fig_map.update_layout(mapbox_style="open-street-map")
-fig_map.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    with profile.stage("map render"):
+        show_chart('map', fig_map, payload_bytes, map_slot)
+    st.caption(map_caption)
 
-st.plotly_chart(fig_map, use_container_width=True)
+    with st.expander("How to read this chart"):
+        st.write("""
+        - Small selections show one dot per accident location  
+        - Larger selections group accidents into grid cells: dot size is the number of accidents in the cell  
+        - Color indicates (mean) temperature at time of accident  
+        - Hover to see details; warmer colors = higher temperatures
+        """)
 
-with st.expander("How to read this chart"):
+    st.markdown("**Observations:**")
     st.write("""
-    - Each dot represents an accident location (sampled for performance)  
-    - Color indicates temperature at time of accident  
-    - Hover to see city, state, time, and temperature  
-    - Warmer colors = higher temperatures
+    - Geographic distribution shows accident hotspots.  
+    - Color coding reveals temperature patterns by location.  
+    - Clustering may indicate high-traffic areas or weather patterns.
     """)
 
-st.markdown("**Observations:**")
-st.write("""
-- Geographic distribution shows accident hotspots.  
-- Color coding reveals temperature patterns by location.  
-- Clustering may indicate high-traffic areas or weather patterns.
-""")
-
-st.markdown("---")
-
-# -----------------------------------------------------------
-# 4) Time Series — Accidents Over Time
-# -----------------------------------------------------------
-st.subheader("4) Accidents Over Time")
-st.write("Question: When do accidents occur most frequently?")
-
-# Convert Start_Time to datetime with error handling
-time_df = filtered_df.copy()
-try:
-    time_df['Start_Time'] = pd.to_datetime(time_df['Start_Time'], errors='coerce')
-    # Remove rows where datetime conversion failed
-    time_df = time_df.dropna(subset=['Start_Time'])
-    
-    if len(time_df) > 0:
-        time_df['Date'] = time_df['Start_Time'].dt.date
-        
-        # Group by date
-        daily_counts = time_df.groupby('Date').size().reset_index(name='Accidents')
-        daily_counts['Date'] = pd.to_datetime(daily_counts['Date'])
-        
-        fig_time = px.line(
-            daily_counts,
-            x='Date',
-            y='Accidents',
-            title='Daily Accident Counts Over Time'
-        )
-        
-        st.plotly_chart(fig_time, use_container_width=True)
-    else:
-        st.warning("No valid dates found for time series analysis.")
-        
-except Exception as e:
-    st.error(f"Error processing dates: {str(e)}")
-    st.info("Skipping time series chart due to date format issues.")
-
-with st.expander("How to read this chart"):
+    st.markdown("---")
+
+    # -----------------------------------------------------------
+    # 4) Time Series — Accidents Over Time
+    # -----------------------------------------------------------
+    st.subheader("4) Accidents Over Time")
+    st.write("Question: When do accidents occur most frequently?")
+
+    # Days come from timestamps parsed at ingest; unparseable ones have no day.
+    # Long ranges are rolled up and thinned to a fixed point budget.
+    time_slot = snapshot_slot('gallery_time', key, charts)
+    try:
+        with profile.stage("time series"):
+            fig_time, time_caption = charts.get_or_compute(
+                ('gallery_time', key), lambda: accidents_over_time_chart(get_summary(), cache=charts)
+            )
+
+        if fig_time is not None:
+            with profile.stage("time series render"):
+                show_chart('time series', fig_time, payload_bytes, time_slot)
+            st.caption(time_caption)
+        else:
+            time_slot.warning("No valid dates found for time series analysis.")
+
+    except Exception as e:
+        time_slot.empty()
+        st.error(f"Error processing dates: {str(e)}")
+        st.info("Skipping time series chart due to date format issues.")
+
+    st.sidebar.caption(payload_caption(payload_bytes))
+
+    with st.expander("How to read this chart"):
+        st.write("""
+        - X axis: Date  
+        - Y axis: Number of accidents per day (per week or month for long ranges)  
+        - Shows temporal patterns in accident frequency  
+        - Peaks may indicate specific events or seasonal patterns
+        """)
+
+    st.markdown("**Observations:**")
     st.write("""
-    - X axis: Date  
-    - Y axis: Number of accidents per day  
-    - Shows temporal patterns in accident frequency  
-    - Peaks may indicate specific events or seasonal patterns
+    - Time series reveals patterns in accident frequency.  
+    - Seasonal or weekly patterns may be visible.  
+    - Filtering by state and temperature affects temporal trends.
     """)
 
-st.markdown("**Observations:**")
-st.write("""
-- Time series reveals patterns in accident frequency.  
-- Seasonal or weekly patterns may be visible.  
-- Filtering by state and temperature affects temporal trends.
-""")
+    st.markdown("---")
+
+    # -----------------------------------------------------------
+    # Profile
+    # -----------------------------------------------------------
+    show_profile(profile.finish(payload_bytes))
+
 
-st.markdown("---")
+filtered_charts()
 
 # -----------------------------------------------------------
 # Ethics & Data Limitations
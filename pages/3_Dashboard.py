@@ -1,9 +1,17 @@
 # pages/3_Dashboard.py
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 from datetime import datetime
 
+from utils.approx import approx_badge, approx_default, await_exact, load_sample, refine, refined
+from utils.charts import state_counts_chart, temperature_over_time_chart
+from utils.crossfilter import crossfilter_payload, show_crossfilter
+from utils.data import load_manifest
+from utils.figures import payload_caption, show_chart
+from utils.memo import get_chart_cache, selection_key
+from utils.metrics import show_profile, start_profile
+from utils.query import load_query
+from utils.snapshots import snapshot_slot
+
 # -----------------------------------------------------------
 # Page Title
 # -----------------------------------------------------------
@@ -12,119 +20,198 @@ st.title("📈 Dashboard — USA Accidents Overview")
 # -----------------------------------------------------------
 # Load Data
 # -----------------------------------------------------------
-@st.cache_data
-def load_data():
-    df = pd.read_csv("data/accidents_small.csv")
-    df['Start_Time'] = pd.to_datetime(df['Start_Time'], errors='coerce')
-    return df
-
-df = load_data()
+# KPIs and charts are answered through the query API (pre-aggregated cube in
+# memory, or a pushed-down scan of a partitioned dataset), not raw rows
+manifest = load_manifest()
 
 # Data source info box
-st.info("📊 **US Accidents Dataset** | Source: [Kaggle](https://www.kaggle.com/datasets/sobhanmoosavi/us-accidents) | Rows: {:,}".format(len(df)))
+st.info("📊 **US Accidents Dataset** | Source: [Kaggle](https://www.kaggle.com/datasets/sobhanmoosavi/us-accidents) | Rows: {:,}".format(manifest['rows']))
 
 # -----------------------------------------------------------
 # Filters
 # -----------------------------------------------------------
 st.sidebar.header("Dashboard Filters")
 
-# States
-states = sorted(df['State'].dropna().unique())
-selected_states = st.sidebar.multiselect("Select States", states, default=states[:5])
-
-# Temperature range filter
-temp_min = float(df['Temperature(F)'].min()) if not df['Temperature(F)'].isna().all() else 0
-temp_max = float(df['Temperature(F)'].max()) if not df['Temperature(F)'].isna().all() else 100
-selected_temp_range = st.sidebar.slider("Temperature Range (°F)", temp_min, temp_max, (temp_min, temp_max))
-
-# Date range with error handling
-try:
-    valid_dates = df['Start_Time'].dropna()
-    if len(valid_dates) > 0:
-        min_date = valid_dates.min().date()
-        max_date = valid_dates.max().date()
-        selected_dates = st.sidebar.date_input(
-            "Select Date Range",
-            value=[min_date, max_date],
-            min_value=min_date,
-            max_value=max_date
-        )
-    else:
-        st.sidebar.warning("No valid dates found")
+# Filters, KPIs and the linked charts run as one fragment: every KPI and chart
+# reads all three filters, so a filter change reruns only this function and
+# the narrative and footer below stay as drawn.
+@st.fragment
+def filtered_dashboard():
+    # Stage timings for this rerun; only recorded with ?profile=1 or ACCIDENTS_PROFILE=1
+    profile = start_profile("dashboard")
+    with profile.stage("load"):
+        query = load_query()
+        charts = get_chart_cache()
+
+    # States
+    states = query.states
+    selected_states = st.sidebar.multiselect("Select States", states, default=states[:5])
+
+    # Temperature range filter
+    temp_min = query.temp_min if query.temp_min is not None else 0
+    temp_max = query.temp_max if query.temp_max is not None else 100
+    selected_temp_range = st.sidebar.slider("Temperature Range (°F)", temp_min, temp_max, (temp_min, temp_max))
+
+    # Date range with error handling
+    try:
+        if query.time_min is not None:
+            min_date = query.time_min.date()
+            max_date = query.time_max.date()
+            selected_dates = st.sidebar.date_input(
+                "Select Date Range",
+                value=[min_date, max_date],
+                min_value=min_date,
+                max_value=max_date
+            )
+        else:
+            st.sidebar.warning("No valid dates found")
+            selected_dates = []
+    except Exception as e:
+        st.sidebar.error(f"Date processing error: {str(e)}")
         selected_dates = []
-except Exception as e:
-    st.sidebar.error(f"Date processing error: {str(e)}")
-    selected_dates = []
-
-# Guard against empty selection
-if isinstance(selected_dates, list) and len(selected_dates) == 2:
-    start_date, end_date = selected_dates
-else:
-    start_date, end_date = min_date, max_date
-
-# Filtered dataframe
-if len(selected_dates) == 2:
-    start_date, end_date = selected_dates
-    filtered_df = df[
-        (df['State'].isin(selected_states)) &
-        (df['Temperature(F)'].between(selected_temp_range[0], selected_temp_range[1])) &
-        (df['Start_Time'].dt.date.between(start_date, end_date))
-    ]
-else:
-    filtered_df = df[
-        (df['State'].isin(selected_states)) &
-        (df['Temperature(F)'].between(selected_temp_range[0], selected_temp_range[1]))
-    ]
 
-# -----------------------------------------------------------
-# KPIs
-# -----------------------------------------------------------
-st.subheader("Key Performance Indicators (KPIs)")
+    # Guard against empty selection
+    if isinstance(selected_dates, list) and len(selected_dates) == 2:
+        start_date, end_date = selected_dates
+    else:
+        start_date, end_date = min_date, max_date
 
-kpi1, kpi2, kpi3, kpi4 = st.columns(4)
+    # Filtered aggregates, memoized per (dataset version, filter selection)
+    if len(selected_dates) == 2:
+        start_date, end_date = selected_dates
+        date_range = (start_date, end_date)
+    else:
+        date_range = None
+    key = selection_key(query, selected_states, selected_temp_range, date_range)
+
+    # On large datasets the first answer for a new selection is estimated from a
+    # stratified sample; the exact one is computed in the background and
+    # replaces it when ready
+    approximate = st.sidebar.toggle(
+        "Fast approximate results", value=approx_default(query),
+        help="Show estimates from a stratified sample while the exact numbers are computed",
+    )
 
-kpi1.metric("Total Accidents", len(filtered_df))
-kpi2.metric("Avg Temperature", f"{round(filtered_df['Temperature(F)'].mean(), 1)}°F" if not filtered_df.empty else "N/A")
-kpi3.metric("Unique States", filtered_df['State'].nunique())
-kpi4.metric("Latest Accident", filtered_df['Start_Time'].max().strftime("%Y-%m-%d") if not filtered_df.empty and not filtered_df['Start_Time'].isna().all() else "N/A")
+    # -----------------------------------------------------------
+    # Layout
+    # -----------------------------------------------------------
+    # Sections are placed before the summary is computed so the pre-rendered
+    # snapshots of the charts, if any, show while it runs
+    st.subheader("Key Performance Indicators (KPIs)")
+    kpis = st.container()
+    st.markdown("---")
+    st.subheader("Linked Charts")
+    bar_slot = snapshot_slot('dashboard_state_bar', key, charts)
+    line_slot = snapshot_slot('dashboard_temp_line', key, charts)
+    st.markdown("---")
+    st.subheader("Cross-filter")
+    crossfilter_area = st.container()
+    st.markdown("---")
+
+    approx = None
+    with profile.stage("summary") as timing:
+        summary = charts.get(('dashboard_summary', key))
+        # Until the sample is built (at warm-up or after an append) the summary is exact
+        sample = load_sample() if summary is None and approximate else None
+        if sample is not None:
+            pending = refine(
+                ('dashboard_summary', key), lambda: query.summary(selected_states, selected_temp_range, date_range)
+            )
+            if pending.done():
+                # A failed refinement falls through to the exact path below
+                summary = refined(pending)
+            else:
+                approx = sample.estimate(selected_states, selected_temp_range, date_range)
+                summary = approx.result
+        if summary is None:
+            summary = charts.get_or_compute(
+                ('dashboard_summary', key), lambda: query.summary(selected_states, selected_temp_range, date_range)
+            )
+        timing["rows"] = summary.total
+    # Estimated charts are memoized apart from the exact ones
+    chart_key = key if approx is None else ('approx', key)
+
+    with profile.stage("filter"):
+        scan = query.scan_stats(selected_states, selected_temp_range, date_range)
+    if scan is not None:
+        st.sidebar.caption(
+            f"Read {scan['files']:,} of {scan['files_total']:,} partition files, "
+            f"{scan['row_groups']:,} of {scan['row_groups_total']:,} row groups"
+        )
 
-st.markdown("---")
+    # -----------------------------------------------------------
+    # KPIs
+    # -----------------------------------------------------------
+    if approx is not None:
+        kpis.badge(approx_badge(approx), icon=":material/hourglass_top:", color="orange")
 
-# -----------------------------------------------------------
-# Charts
-# -----------------------------------------------------------
-st.subheader("Linked Charts")
-
-# 1) Accidents by State (Bar)
-if not filtered_df.empty:
-    state_counts = filtered_df['State'].value_counts().reset_index()
-    state_counts.columns = ['State', 'Count']
-    fig_state = px.bar(
-        state_counts,
-        x='State', y='Count',
-        title="Accidents by State",
-        text='Count'
-    )
-    st.plotly_chart(fig_state, use_container_width=True)
-
-    # 2) Temperature over Time (Line)
-    temp_time = filtered_df.dropna(subset=['Start_Time', 'Temperature(F)']).copy()
-    if len(temp_time) > 0:
-        temp_time['Date'] = temp_time['Start_Time'].dt.date
-        daily_temp = temp_time.groupby('Date')['Temperature(F)'].mean().reset_index()
-        daily_temp['Date'] = pd.to_datetime(daily_temp['Date'])
-        fig_line = px.line(
-            daily_temp,
-            x='Date', y='Temperature(F)',
-            title="Average Temperature Over Time"
+    kpi1, kpi2, kpi3, kpi4 = kpis.columns(4)
+
+    if approx is None:
+        kpi1.metric("Total Accidents", summary.total)
+        kpi2.metric("Avg Temperature", f"{round(summary.temp_mean, 1)}°F" if summary.temp_mean is not None else "N/A")
+    else:
+        # 95% intervals from the sample
+        kpi1.metric("Total Accidents", f"≈{summary.total:,} ±{approx.total_error:,.0f}")
+        kpi2.metric(
+            "Avg Temperature",
+            f"≈{summary.temp_mean:.1f} ±{approx.temp_mean_error:.1f}°F" if summary.temp_mean is not None else "N/A",
         )
-        st.plotly_chart(fig_line, use_container_width=True)
+    kpi3.metric("Unique States", summary.unique_states)
+    kpi4.metric("Latest Accident", summary.latest.strftime("%Y-%m-%d") if summary.latest is not None else "N/A")
+
+    # -----------------------------------------------------------
+    # Charts
+    # -----------------------------------------------------------
+    payload_bytes = {}
+
+    # 1) Accidents by State (Bar)
+    if summary.total > 0:
+        with profile.stage("bar"):
+            fig_state = charts.get_or_compute(
+                ('dashboard_state_bar', chart_key), lambda: state_counts_chart(summary, cache=charts)
+            )
+        with profile.stage("bar render"):
+            show_chart('bar', fig_state, payload_bytes, bar_slot)
+
+        # 2) Temperature over Time (Line), rolled up and thinned for long ranges
+        with profile.stage("temperature line"):
+            fig_line = charts.get_or_compute(
+                ('dashboard_temp_line', chart_key), lambda: temperature_over_time_chart(summary, cache=charts)
+            )
+        if fig_line is not None:
+            with profile.stage("temperature line render"):
+                show_chart('temperature line', fig_line, payload_bytes, line_slot)
+        else:
+            line_slot.info("No valid temperature data for selected filters.")
+
+        # 3) Cross-filter: the selection's (State, day) cells are shipped once;
+        # brushing dates and picking states are then answered in the browser
+        if approx is not None:
+            crossfilter_area.caption("Available once the exact results are loaded.")
+        else:
+            with profile.stage("crossfilter"):
+                cells = charts.get_or_compute(
+                    ('dashboard_crossfilter', key),
+                    lambda: crossfilter_payload(query.daily_cells(selected_states, selected_temp_range, date_range))
+                )
+            with profile.stage("crossfilter render"):
+                show_crossfilter(cells, payload_bytes, crossfilter_area)
     else:
-        st.info("No valid temperature data for selected filters.")
-else:
-    st.warning("No data available for the selected filters.")
+        bar_slot.warning("No data available for the selected filters.")
+        line_slot.empty()
 
-st.markdown("---")
+    if payload_bytes:
+        st.sidebar.caption(payload_caption(payload_bytes))
+
+    show_profile(profile.finish(payload_bytes))
+
+    if approx is not None:
+        # Polls the background computation and reruns the page once it is done
+        await_exact(pending)
+
+
+filtered_dashboard()
 
 # -----------------------------------------------------------
 # Narrative / Insights
@@ -143,4 +230,7 @@ st.info("⚖️ **Ethics Note:** This data represents real traffic incidents aff
 # Footer
 # -----------------------------------------------------------
 st.markdown("---")
-st.caption(f"Data source: Kaggle — USA Accidents Dataset | Last refreshed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+# The watermark is the latest accident in the data, not the time of this rerun
+watermark = manifest['watermark'][:16].replace('T', ' ') if manifest['watermark'] else "N/A"
+refreshed = datetime.fromisoformat(manifest['refreshed']).strftime('%Y-%m-%d %H:%M')
+st.caption(f"Data source: Kaggle — USA Accidents Dataset | Data through: {watermark} | Last refreshed: {refreshed}")
@@ -0,0 +1,62 @@
+"""Row-partitioned reductions agree with the single-pass path.
+
+The partition threshold is lowered so a few thousand rows are split, which
+exercises the per-partition reductions and their merges on a small machine.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import parallel
+from utils.cube import group_cells, row_cells, summarize
+from utils.geo import bin_points
+from utils.hist import bin_counts, histogram_edges
+
+ROWS = 5_000
+
+
+@pytest.fixture(scope="module")
+def rows():
+    rng = np.random.default_rng(3)
+    temps = rng.normal(60, 20, ROWS).round(1)
+    temps[rng.random(ROWS) < 0.1] = np.nan
+    times = pd.Series(pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, 400 * 86_400, ROWS), unit="s"))
+    times[rng.random(ROWS) < 0.02] = pd.NaT
+    return pd.DataFrame({
+        "State": rng.choice(["CA", "FL", "NY", "TX", "WA"], ROWS),
+        "Start_Time": times,
+        "Temperature(F)": temps,
+        "Start_Lat": rng.uniform(25, 49, ROWS),
+        "Start_Lng": rng.uniform(-124, -67, ROWS),
+    })
+
+
+def _results(rows):
+    cells = row_cells(rows["State"], rows["Start_Time"], rows["Temperature(F)"])
+    located = rows.dropna(subset=["Temperature(F)"])
+    edges = histogram_edges(rows["Temperature(F)"].min(), rows["Temperature(F)"].max())
+    return (
+        summarize(*cells),
+        group_cells(*cells),
+        bin_counts(rows["Temperature(F)"], edges),
+        bin_points(located["Start_Lat"], located["Start_Lng"], located["Temperature(F)"]),
+    )
+
+
+def test_partitioned_reductions_match_single_pass(rows, monkeypatch):
+    single = _results(rows)
+
+    monkeypatch.setattr(parallel, "MIN_PARTITION_ROWS", 700)
+    monkeypatch.setattr(parallel, "WORKERS", 4)
+    assert len(parallel.row_slices(ROWS)) == 4
+    split = _results(rows)
+
+    (summary, daily, hist, geo), (p_summary, p_daily, p_hist, p_geo) = single, split
+    assert (p_summary.total, p_summary.temp_count, p_summary.latest) == (summary.total, summary.temp_count, summary.latest)
+    assert p_summary.temp_sum == pytest.approx(summary.temp_sum)
+    pd.testing.assert_frame_equal(p_summary.by_state, summary.by_state)
+    pd.testing.assert_frame_equal(p_summary.daily, summary.daily)
+    pd.testing.assert_frame_equal(p_daily, daily)
+    np.testing.assert_array_equal(p_hist, hist)
+    assert (p_geo.cell_size, p_geo.n_points) == (geo.cell_size, geo.n_points)
+    pd.testing.assert_frame_equal(p_geo.cells, geo.cells)
@@ -0,0 +1,73 @@
+"""Backend parity on a small synthetic dataset.
+
+Every backend must agree with the others (``check_parity``) and with a plain
+pandas filter of the source CSV, including temperature bounds that equal
+stored readings: slider values such as 104.6 are not exact in float32.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.bench import synthesize
+from utils.data import ensure_columnar, load_manifest
+from utils.query import HAS_DUCKDB, DuckDBQuery, InMemoryQuery, PartitionedQuery, check_parity, default_selections
+
+ROWS = 3_000
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    # CACHE_DIR is relative, so the ingest writes under the temporary directory.
+    root = tmp_path_factory.mktemp("accidents")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        csv_path = synthesize(ROWS, root / "accidents_test.csv", seed=7)
+        ensure_columnar(csv_path)
+        yield csv_path, load_manifest(csv_path)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def reference(dataset):
+    # Read as float64 text values, the way a user reads the CSV.
+    return pd.read_csv(dataset[0], usecols=["State", "Temperature(F)"])
+
+
+def _backends(dataset):
+    csv_path, manifest = dataset
+    backends = [InMemoryQuery(manifest, csv_path), PartitionedQuery(manifest, csv_path)]
+    if HAS_DUCKDB:
+        backends.append(DuckDBQuery(manifest, csv_path))
+    return backends
+
+
+def _boundary_selections(reference, count=12, seed=0):
+    """Selections whose bounds are readings of the selected states."""
+    rng = np.random.default_rng(seed)
+    selections = []
+    for state in rng.choice(reference["State"].unique(), size=count, replace=False):
+        temps = reference.loc[reference["State"] == state, "Temperature(F)"].dropna().to_numpy()
+        lo, hi = np.sort(rng.choice(temps, size=2))
+        selections.append(([str(state)], (float(lo), float(hi)), None))
+        selections.append(([str(state)], (float(lo), float(lo)), None))
+    return selections
+
+
+def test_backends_agree(dataset, reference):
+    reference_backend, *others = _backends(dataset)
+    selections = default_selections(reference_backend) + _boundary_selections(reference)
+    for other in others:
+        assert check_parity(reference_backend, other, selections) == []
+
+
+def test_bounds_equal_to_readings_are_inclusive(dataset, reference):
+    for states, temp_range, _ in _boundary_selections(reference):
+        rows = reference[reference["State"].isin(states)]
+        expected = int(rows["Temperature(F)"].between(*temp_range).sum())
+        for backend in _backends(dataset):
+            assert backend.summary(states, temp_range).total == expected, (backend.name, states, temp_range)
+            assert int(backend.histogram(states, temp_range).sum()) == expected, (backend.name, states, temp_range)
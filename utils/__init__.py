@@ -0,0 +1 @@
+"""Shared data and compute helpers for the Streamlit pages."""
@@ -0,0 +1,300 @@
+# utils/approx.py
+"""Approximate Dashboard answers from a stratified sample, refined in the background.
+
+``StratifiedSample`` keeps a fixed fraction of the rows of every
+(State, month) stratum, with at least ``MIN_PER_STRATUM`` rows (or the whole
+stratum), so small states and quiet months are still represented. A
+selection is estimated with the usual stratified estimators: the total as
+``sum(N_h / n_h * matches_h)``, the mean temperature as a ratio estimate,
+each with a 95% half-width from the within-stratum variances. The cost of an
+estimate depends on the sample size, not on the dataset size.
+
+The sample is built on a background thread (``sample_future``, started by
+the warm-up when estimates are on) for every dataset version; until it is
+ready ``load_sample`` returns ``None`` and the Dashboard answers exactly.
+``refine`` computes the exact answer on a background pool and stores it in
+the chart cache; ``await_exact`` is a polling fragment that reruns the page
+once it is there, so the exact numbers replace the estimate.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.cube import _NAT, _NS_PER_DAY, CubeResult
+from utils.data import CSV_PATH, data_version, load_accidents, load_manifest, stored_temp_range
+from utils.memo import get_chart_cache
+
+SAMPLE_RATE = 0.02
+MIN_PER_STRATUM = 30
+# "auto" approximates scanned datasets of at least APPROX_MIN_ROWS rows; "on"/"off" force it.
+APPROX_MODE = os.environ.get("ACCIDENTS_APPROX", "auto")
+APPROX_MIN_ROWS = 2_000_000
+REFINE_WORKERS = 2
+REFINE_POLL_SECONDS = 0.5
+Z_95 = 1.959964
+
+_SAMPLE_COLUMNS = ["State", "Start_Time", "Temperature(F)"]
+_PENDING_KEY = "_approx_refining"
+
+
+@dataclass
+class ApproxResult:
+    """A ``CubeResult`` estimated from the sample, with 95% half-widths."""
+
+    result: CubeResult  # by_state carries an extra Error column
+    total_error: float
+    temp_mean_error: float | None
+    sample_rows: int
+
+    @property
+    def relative_error(self):
+        return self.total_error / self.result.total if self.result.total else 0.0
+
+
+class StratifiedSample:
+    """Rows sampled per (State, month) stratum, with the stratum sizes."""
+
+    def __init__(self, state, start_time, temperature, rate=SAMPLE_RATE, min_rows=MIN_PER_STRATUM, seed=0):
+        state = pd.Categorical(state)
+        self.categories = list(state.categories)
+        codes = np.asarray(state.codes, dtype=np.int64)
+        times = pd.to_datetime(pd.Series(start_time)).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        temps = np.asarray(temperature, dtype=np.float64)
+        keep = codes >= 0  # rows without a state are in no summary
+        codes, times, temps = codes[keep], times[keep], temps[keep]
+
+        # Month index, with one extra "no timestamp" month per state.
+        months = np.where(times == _NAT, -1, times.view("datetime64[ns]").astype("datetime64[M]").astype(np.int64))
+        month_values, month_index = np.unique(months, return_inverse=True)
+        strata = codes * len(month_values) + month_index
+        self.stratum_rows = np.bincount(strata, minlength=len(self.categories) * len(month_values))
+        self.stratum_sample = np.minimum(
+            self.stratum_rows, np.maximum(min_rows, np.ceil(rate * self.stratum_rows)).astype(np.int64)
+        )
+
+        # A random order within each stratum; keep the first n_h rows of each.
+        rng = np.random.default_rng(seed)
+        order = np.lexsort((rng.random(len(strata)), strata))
+        sorted_strata = strata[order]
+        starts = np.searchsorted(sorted_strata, sorted_strata, side="left")
+        picked = order[np.arange(len(order)) - starts < self.stratum_sample[sorted_strata]]
+
+        self.strata = strata[picked]
+        self.state = codes[picked]
+        self.time = times[picked]
+        self.day = np.where(self.time == _NAT, _NAT, self.time // _NS_PER_DAY)
+        self.temp = temps[picked]
+        self.weight = self.stratum_rows[self.strata] / self.stratum_sample[self.strata]
+
+    def __len__(self):
+        return len(self.strata)
+
+    def _stratum_variance(self, values):
+        # sum_h N_h^2 (1 - n_h/N_h) s_h^2 / n_h, with s_h^2 the sample variance of ``values`` in h.
+        n_strata = len(self.stratum_rows)
+        n = self.stratum_sample.astype(np.float64)
+        total = np.bincount(self.strata, weights=values, minlength=n_strata)
+        squares = np.bincount(self.strata, weights=values * values, minlength=n_strata)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            s2 = (squares - total * total / n) / (n - 1)
+            term = self.stratum_rows**2 * (1 - n / self.stratum_rows) * s2 / n
+        return float(np.nansum(term[n > 1]))
+
+    def _by_state_errors(self, hit):
+        n_strata = len(self.stratum_rows)
+        n = self.stratum_sample.astype(np.float64)
+        total = np.bincount(self.strata, weights=hit, minlength=n_strata)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            s2 = (total - total * total / n) / (n - 1)
+            term = np.where(n > 1, self.stratum_rows**2 * (1 - n / self.stratum_rows) * s2 / n, 0.0)
+        per_state = np.nan_to_num(term).reshape(len(self.categories), -1).sum(axis=1)
+        return Z_95 * np.sqrt(per_state)
+
+    def estimate(self, states, temp_range=None, date_range=None):
+        """``ApproxResult`` for a selection, with the semantics of ``FilterIndex.select``."""
+        wanted = np.isin(np.asarray(self.categories, dtype=object), list(states))
+        hit = wanted[self.state]
+        if temp_range is not None:
+            lo, hi = stored_temp_range(temp_range)
+            hit &= (self.temp >= lo) & (self.temp <= hi)
+        if date_range is not None:
+            start, end = (np.datetime64(d, "D").astype(np.int64) for d in date_range)
+            hit &= (self.day != _NAT) & (self.day >= start) & (self.day <= end)
+        has_temp = hit & ~np.isnan(self.temp)
+        weight = self.weight
+
+        total = float(weight[hit].sum())
+        total_error = Z_95 * np.sqrt(self._stratum_variance(hit.astype(np.float64)))
+        temp_count = float(weight[has_temp].sum())
+        temp_sum = float((weight * np.where(has_temp, self.temp, 0.0)).sum())
+        temp_mean_error = None
+        if temp_count:
+            # Linearized ratio estimator: residuals of the matching readings around the estimate.
+            residual = np.where(has_temp, self.temp - temp_sum / temp_count, 0.0) / temp_count
+            temp_mean_error = Z_95 * np.sqrt(self._stratum_variance(residual))
+
+        counts = np.bincount(self.state[hit], weights=weight[hit], minlength=len(self.categories))
+        errors = self._by_state_errors(hit.astype(np.float64))
+        shown = np.flatnonzero(counts)
+        by_state = pd.DataFrame({
+            "State": [self.categories[c] for c in shown],
+            "Count": np.rint(counts[shown]).astype(np.int64),
+            "Error": errors[shown],
+        }).sort_values("Count", ascending=False, kind="stable", ignore_index=True)
+
+        dated = hit & (self.day != _NAT)
+        daily = pd.DataFrame({"day": self.day[dated], "w": weight[dated],
+                              "t": np.where(has_temp, self.temp, 0.0)[dated] * weight[dated],
+                              "r": weight[dated] * has_temp[dated]}).groupby("day").sum()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            daily_temp = (daily["t"] / daily["r"]).to_numpy()
+        daily = pd.DataFrame({
+            "Date": daily.index.to_numpy().astype("datetime64[D]").astype("datetime64[ns]"),
+            "Accidents": np.rint(daily["w"].to_numpy()).astype(np.int64),
+            "Temperature(F)": daily_temp,
+            "Readings": np.rint(daily["r"].to_numpy()).astype(np.int64),
+        })
+
+        latest = self.time[hit & (self.time != _NAT)]
+        result = CubeResult(
+            total=int(round(total)),
+            temp_sum=temp_sum,
+            temp_count=temp_count,
+            latest=pd.Timestamp(latest.max()) if len(latest) else None,  # latest sampled, a lower bound
+            by_state=by_state,
+            daily=daily,
+        )
+        return ApproxResult(result, float(total_error), temp_mean_error, len(self))
+
+
+# -----------------------------------------------------------
+# Shared sample
+# -----------------------------------------------------------
+def _build_sample(csv_path):
+    manifest = load_manifest(csv_path)
+    if manifest.get("layout") == "partitioned":
+        from utils.store import load_store
+
+        df = load_store(csv_path).scan(_SAMPLE_COLUMNS)
+    else:
+        df = load_accidents(_SAMPLE_COLUMNS, csv_path)
+    return StratifiedSample(df["State"], df["Start_Time"], df["Temperature(F)"])
+
+
+@st.cache_resource(max_entries=2)
+def _sample_future(csv_path, version):
+    # Built once per dataset version, off the page thread: sampling scans every row.
+    return _refine_pool().submit(_build_sample, csv_path)
+
+
+def sample_future(csv_path=CSV_PATH):
+    """Future of the shared ``StratifiedSample`` for the current dataset version."""
+    return _sample_future(str(csv_path), data_version(load_manifest(csv_path)))
+
+
+def load_sample(csv_path=CSV_PATH):
+    """Return the shared ``StratifiedSample``, or ``None`` while it is still being built (or failed)."""
+    future = sample_future(csv_path)
+    if not future.done() or future.exception() is not None:
+        return None
+    return future.result()
+
+
+def approx_default(query, csv_path=CSV_PATH):
+    """Whether the Dashboard should start with estimates.
+
+    ``ACCIDENTS_APPROX=on``/``off`` decides; otherwise only large datasets on
+    a scanning backend (the in-memory cube already answers in milliseconds).
+    """
+    if APPROX_MODE in ("on", "off"):
+        return APPROX_MODE == "on"
+    return query.name != "memory" and load_manifest(csv_path)["rows"] >= APPROX_MIN_ROWS
+
+
+# -----------------------------------------------------------
+# Background refinement
+# -----------------------------------------------------------
+@st.cache_resource
+def _refine_pool():
+    return ThreadPoolExecutor(max_workers=REFINE_WORKERS, thread_name_prefix="refine")
+
+
+@dataclass
+class _Refinement:
+    """A background computation and the number of sessions waiting for it."""
+
+    future: object
+    waiters: int = 0
+
+
+_inflight = {}  # key -> _Refinement, until its computation finishes
+_inflight_lock = threading.Lock()
+
+
+def _compute_into_cache(key, compute):
+    try:
+        return get_chart_cache().get_or_compute(key, compute)
+    finally:
+        # Failures are evicted too: the next request for the key starts over.
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _release(key, future):
+    # The session moved on; cancel the computation if nobody else waits for it.
+    with _inflight_lock:
+        refinement = _inflight.get(key)
+        if refinement is None or refinement.future is not future:
+            return
+        refinement.waiters -= 1
+        if refinement.waiters <= 0 and future.cancel():
+            del _inflight[key]
+
+
+def refine(key, compute):
+    """Start computing ``compute()`` into the chart cache under ``key``; return its future.
+
+    Requests for the same key share one computation. When a session moves on
+    to another key, its previous request is cancelled if it has not started
+    and no other session waits for it, so dragging a slider does not queue up
+    every intermediate selection. A finished (or failed) future is returned
+    to the session until it changes key; the page then computes on its own
+    thread instead of retrying in the background.
+    """
+    previous = st.session_state.get(_PENDING_KEY)
+    if previous is not None and previous[0] == key and previous[1].done():
+        return previous[1]
+    with _inflight_lock:
+        refinement = _inflight.get(key)
+        if refinement is None:
+            refinement = _inflight[key] = _Refinement(_refine_pool().submit(_compute_into_cache, key, compute))
+        if previous is None or previous[1] is not refinement.future:
+            refinement.waiters += 1
+    if previous is not None and previous[1] is not refinement.future:
+        _release(*previous)
+    st.session_state[_PENDING_KEY] = (key, refinement.future)
+    return refinement.future
+
+
+def refined(future):
+    """The exact answer of a finished ``refine`` future, or ``None`` if it failed or was cancelled."""
+    if future.cancelled() or future.exception() is not None:
+        return None
+    return future.result()
+
+
+@st.fragment(run_every=REFINE_POLL_SECONDS)
+def await_exact(future):
+    """Rerun the page once ``future`` is done, so its exact answer replaces the estimate."""
+    if future.done():
+        st.rerun()
+
+
+def approx_badge(approx):
+    """Badge text for an estimate: the 95% relative error of the total."""
+    return f"Approximate ±{approx.relative_error:.1%} · exact results loading"
@@ -0,0 +1,250 @@
+# utils/bench.py
+"""Headless benchmark of the ingest, filter, aggregate and render paths.
+
+Generates synthetic US-Accidents-shaped CSVs (the columns the pages use) and
+times, per size, the same calls the pages make: CSV load and timestamp
+parsing, the columnar ingest, building the shared engines, the sidebar
+filter, every Gallery and Dashboard chart computation (``utils.charts``) and
+the JSON serialization Streamlit performs on each rerun. Every size runs in
+its own process so ``peak_rss_mb`` belongs to that size alone::
+
+    python -m utils.bench --rows 100000 1000000 10000000 --out data/bench/results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path("data/bench")
+DEFAULT_ROWS = [100_000, 1_000_000, 10_000_000]
+GENERATE_CHUNK_ROWS = 1_000_000
+STATES = [
+    "AL", "AR", "AZ", "CA", "CO", "CT", "DC", "DE", "FL", "GA", "IA", "ID", "IL", "IN", "KS", "KY", "LA",
+    "MA", "MD", "ME", "MI", "MN", "MO", "MS", "MT", "NC", "ND", "NE", "NH", "NJ", "NM", "NV", "NY", "OH",
+    "OK", "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VA", "VT", "WA", "WI", "WV", "WY",
+]
+CITIES_PER_STATE = 40
+TIME_START = np.datetime64("2016-02-08T00:00:00")
+TIME_SPAN_S = 7 * 365 * 86_400
+
+
+# -----------------------------------------------------------
+# Synthetic data
+# -----------------------------------------------------------
+def _synthetic_chunk(rng, rows):
+    # Skewed state mix, per-state coordinates and seasonal temperatures, with
+    # the same gaps and timestamp variants as the Kaggle export.
+    weights = rng.pareto(1.5, len(STATES)) + 1
+    state_idx = rng.choice(len(STATES), rows, p=weights / weights.sum())
+    centers = np.column_stack([np.linspace(26, 47, len(STATES)), np.linspace(-122, -70, len(STATES))])
+    seconds = rng.integers(0, TIME_SPAN_S, rows)
+    times = TIME_START + seconds.astype("timedelta64[s]")
+    day_of_year = (seconds // 86_400) % 365
+    temps = 55 + 25 * np.sin(2 * np.pi * (day_of_year - 105) / 365) + rng.normal(0, 10, rows)
+    temps[rng.random(rows) < 0.03] = np.nan
+    lat = centers[state_idx, 0] + rng.normal(0, 1.0, rows)
+    lng = centers[state_idx, 1] + rng.normal(0, 1.5, rows)
+    lat[rng.random(rows) < 0.005] = np.nan
+
+    stamps = np.char.replace(np.datetime_as_string(times, unit="s"), "T", " ").astype(object)
+    fractional = rng.random(rows) < 0.2
+    stamps[fractional] = stamps[fractional] + ".000000000"
+    states = np.asarray(STATES)[state_idx]
+    return pd.DataFrame({
+        "State": states,
+        "City": np.char.add(np.char.add(states, " City "), rng.integers(0, CITIES_PER_STATE, rows).astype(str)),
+        "Temperature(F)": temps.round(1),
+        "Start_Time": stamps,
+        "Start_Lat": lat.round(5),
+        "Start_Lng": lng.round(5),
+    })
+
+
+def synthesize(rows, path, seed=0):
+    """Write ``rows`` synthetic accidents to ``path`` (in chunks, so any size fits in memory)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    tmp = path.with_suffix(".tmp")
+    for start in range(0, rows, GENERATE_CHUNK_ROWS):
+        chunk = _synthetic_chunk(rng, min(GENERATE_CHUNK_ROWS, rows - start))
+        chunk.to_csv(tmp, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+# -----------------------------------------------------------
+# Timing
+# -----------------------------------------------------------
+def _time(func, repeat=1, before=None):
+    runs, result = [], None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - started)
+    return result, {"seconds": min(runs), "median": statistics.median(runs), "runs": len(runs)}
+
+
+def bench_size(rows, repeat=3, seed=0):
+    """Benchmark one dataset size in this process; return its result dict."""
+    from utils.charts import (
+        accidents_over_time_chart, location_map_chart, state_counts_chart, temperature_histogram_chart,
+        temperature_over_time_chart,
+    )
+    from utils.data import columnar_paths, ensure_columnar, parse_timestamps
+    from utils.filters import load_filter_index
+    from utils.ingest import CHUNK_ROWS, _peak_rss_mb
+    from utils.memo import get_chart_cache
+    from utils.query import load_query
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    import plotly.tools
+
+    csv_path = BENCH_DIR / f"accidents_{rows}.csv"
+    steps = {}
+    if not csv_path.exists():
+        _, steps["generate_csv"] = _time(lambda: synthesize(rows, csv_path, seed))
+
+    # CSV load and timestamp parsing, chunked like the streaming ingest so
+    # every size fits in memory; reported as totals over all chunks.
+    load_s = parse_s = 0.0
+    reader = pd.read_csv(csv_path, chunksize=CHUNK_ROWS)
+    while True:
+        started = time.perf_counter()
+        chunk = next(reader, None)
+        load_s += time.perf_counter() - started
+        if chunk is None:
+            break
+        started = time.perf_counter()
+        parse_timestamps(chunk["Start_Time"])
+        parse_s += time.perf_counter() - started
+    steps["csv_load"] = {"seconds": load_s, "median": load_s, "runs": 1}
+    steps["parse_timestamps"] = {"seconds": parse_s, "median": parse_s, "runs": 1}
+
+    # Fresh columnar copy: the ingest is part of what is measured.
+    parquet_path, manifest_path = columnar_paths(csv_path)
+    manifest_path.unlink(missing_ok=True)
+    _, steps["ingest"] = _time(lambda: ensure_columnar(csv_path))
+    query, steps["load_engines"] = _time(lambda: load_query(csv_path))
+
+    cache = get_chart_cache()
+    states = query.states[:5]
+    temp_range = (query.temp_min, query.temp_max)
+    mid = (query.temp_min + query.temp_max) / 2
+    narrow = (query.states[:2], (mid - 15.25, mid + 15.25), (date(2018, 1, 1), date(2018, 6, 30)))
+
+    if query.name == "memory":
+        index = load_filter_index(csv_path)
+        _, steps["filter.default"] = _time(lambda: index.select(states, temp_range), repeat)
+        _, steps["filter.narrow"] = _time(lambda: index.select(*narrow), repeat)
+
+    # Each chart step starts from an empty chart cache, like a first visit.
+    def timed(name, func):
+        result, steps[name] = _time(func, repeat, before=cache.clear)
+        return result
+
+    summary = timed("gallery.summary", lambda: query.summary(states, temp_range))
+    payloads = {
+        "gallery.bar": timed("gallery.bar", lambda: state_counts_chart(summary, horizontal=True)),
+        "gallery.histogram": timed(
+            "gallery.histogram", lambda: temperature_histogram_chart(query, states, temp_range)
+        ),
+        "gallery.map": timed("gallery.map", lambda: location_map_chart(query, states, temp_range)[0]),
+        "gallery.time": timed("gallery.time", lambda: accidents_over_time_chart(summary)[0]),
+    }
+    dashboard = timed("dashboard.summary", lambda: query.summary(*narrow))
+    timed("dashboard.kpis", lambda: (dashboard.total, dashboard.temp_mean, dashboard.unique_states, dashboard.latest))
+    payloads["dashboard.bar"] = timed("dashboard.bar", lambda: state_counts_chart(dashboard))
+    payloads["dashboard.temperature_line"] = timed(
+        "dashboard.temperature_line", lambda: temperature_over_time_chart(dashboard)
+    )
+
+    # What show_chart and st.plotly_chart do with every cached payload on every rerun.
+    def render(spec):
+        figure = go.Figure(json.loads(spec), _validate=False)
+        return pio.to_json(plotly.tools.return_figure_from_figure_or_data(figure, validate_figure=True), validate=False)
+
+    payload_bytes = {}
+    for name, payload in payloads.items():
+        if payload is None:
+            continue
+        _, steps[f"render.{name}"] = _time(lambda: render(payload.spec), repeat)
+        payload_bytes[name] = payload.nbytes
+
+    return {
+        "rows": rows,
+        "csv_bytes": csv_path.stat().st_size,
+        "layout": query.__class__.__name__,
+        "backend": query.name,
+        "steps": {name: {k: round(v, 6) if isinstance(v, float) else v for k, v in s.items()} for name, s in steps.items()},
+        "payload_bytes": payload_bytes,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+def _run_child(rows, repeat, seed):
+    out = subprocess.run(
+        [sys.executable, "-m", "utils.bench", "--child", str(rows), "--repeat", str(repeat), "--seed", str(seed)],
+        capture_output=True, text=True, env={**os.environ, "PYTHONPATH": "."},
+    )
+    if out.returncode != 0:
+        return {"rows": rows, "error": out.stderr.strip().splitlines()[-1:]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the page logic on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per filter/chart step (min is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=str(BENCH_DIR / "results.json"))
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(bench_size(args.child, args.repeat, args.seed)))
+        return 0
+
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sizes": [],
+    }
+    for rows in args.rows:
+        result = _run_child(rows, args.repeat, args.seed)
+        results["sizes"].append(result)
+        if "error" in result:
+            print(f"{rows:>12,} rows  failed: {result['error']}")
+            continue
+        steps = result["steps"]
+        slowest = sorted(steps, key=lambda name: steps[name]["seconds"], reverse=True)[:3]
+        print(
+            f"{rows:>12,} rows  {result['backend']:<12} peak {result['peak_rss_mb']:>8,.0f} MB  "
+            + "  ".join(f"{name} {steps[name]['seconds']:.3f}s" for name in slowest)
+        )
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"wrote {out}")
+    return 0 if all("error" not in r for r in results["sizes"]) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+# utils/charts.py
+"""The computations behind every Gallery and Dashboard chart.
+
+Each function takes a query backend (see ``utils.query``) and a sidebar
+selection and returns what the page draws: ``ChartPayload`` objects plus
+captions. The pages wrap these calls in the chart cache; ``utils.bench``
+calls them directly to time each chart headlessly. ``cache`` is only used to
+share identical payloads (see ``utils.figures.chart_payload``).
+"""
+from utils.figures import chart_payload, density_map, histogram_bars, points_map, state_bar, time_line
+from utils.geo import RAW_POINT_LIMIT
+from utils.timeseries import RESOLUTION_LABELS, downsample
+
+
+def state_counts_chart(summary, horizontal=False, cache=None):
+    """Accidents by State bar chart from a ``CubeResult``."""
+    return chart_payload(state_bar(summary.by_state, "Accidents by State", horizontal=horizontal), cache)
+
+
+def temperature_histogram_chart(query, states, temp_range=None, cache=None):
+    """Temperature distribution drawn from server-side bin counts."""
+    counts = query.histogram(states, temp_range)
+    return chart_payload(histogram_bars(query.histogram_edges, counts, "Temperature Distribution of Accidents"), cache)
+
+
+def location_map_chart(query, states, temp_range=None, cache=None):
+    """``(payload, caption)`` for the map: raw points when few, grid cells otherwise."""
+    grid = query.geo(states, temp_range)
+    if grid.n_points <= RAW_POINT_LIMIT:
+        fig = points_map(query.points(states, temp_range))
+        caption = f"{grid.n_points:,} individual accident locations"
+    else:
+        fig = density_map(grid.cells)
+        caption = (
+            f"{grid.n_points:,} accidents aggregated into {len(grid.cells):,} "
+            f"grid cells of {grid.cell_size}°"
+        )
+    return chart_payload(fig, cache), caption
+
+
+def accidents_over_time_chart(summary, cache=None):
+    """``(payload, caption)`` for the accident-count line, or ``(None, None)`` without dates."""
+    daily = summary.daily
+    if len(daily) == 0:
+        return None, None
+    series, resolution = downsample(daily, "Accidents")
+    label = RESOLUTION_LABELS[resolution]
+    fig = time_line(series["Date"], series["Accidents"], f"{label} Accident Counts Over Time", "Accidents")
+    return chart_payload(fig, cache), f"{label} totals • {len(series):,} points of {len(daily):,} days"
+
+
+def temperature_over_time_chart(summary, cache=None):
+    """Average-temperature line, or None when no day has a temperature."""
+    series, resolution = downsample(summary.daily, "Temperature(F)")
+    if len(series) == 0:
+        return None
+    title = f"{RESOLUTION_LABELS[resolution]} Average Temperature Over Time"
+    return chart_payload(time_line(series["Date"], series["Temperature(F)"], title, "Temperature(F)", ".1f"), cache)
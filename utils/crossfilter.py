@@ -0,0 +1,74 @@
+# utils/crossfilter.py
+"""Client-side cross-filtering for the Dashboard.
+
+The sidebar selection is sent to the browser once, as per (State, day)
+cells (``AccidentQuery.daily_cells``) packed into little-endian typed
+arrays: day offset (uint16), state code (uint8), count, temperature sum and
+readings. The ``components/crossfilter`` component then answers brushing on
+the time series, clicks on the state bars and the KPIs over both without a
+server rerun. A few thousand cells cover several states over seven years,
+where rows would be millions.
+"""
+import base64
+import hashlib
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import streamlit.components.v1 as components
+
+from utils.cube import _NAT
+
+COMPONENT_DIR = Path(__file__).resolve().parent.parent / "components" / "crossfilter"
+COMPONENT_HEIGHT = 460
+UNDATED = 0xFFFF  # day offset of rows without a timestamp
+
+_component = components.declare_component("crossfilter", path=str(COMPONENT_DIR))
+
+
+@dataclass
+class CrossfilterPayload:
+    """The component's argument, with its size on the wire."""
+
+    data: dict
+    nbytes: int
+
+
+def _b64(values, dtype):
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode("ascii")
+
+
+def crossfilter_payload(cells):
+    """Pack a ``group_cells`` frame for the component."""
+    day = cells["day"].to_numpy(np.int64)
+    dated = day != _NAT
+    day0 = int(day[dated].min()) if dated.any() else 0
+    offsets = np.where(dated, day - day0, UNDATED)
+    if offsets[dated].max(initial=0) >= UNDATED:
+        raise ValueError("date span too long for uint16 day offsets")
+    order = np.argsort(offsets, kind="stable")  # by day, undated cells last
+
+    states = cells["State"].cat.remove_unused_categories()
+    names = [str(s) for s in states.cat.categories]
+    data = {
+        "states": names,
+        "day0": day0,
+        "days": int(offsets[dated].max(initial=-1)) + 1,
+        "day": _b64(offsets[order], "<u2"),
+        "state": _b64(states.cat.codes.to_numpy()[order], "<u2" if len(names) > 255 else "u1"),
+        "count": _b64(cells["Accidents"].to_numpy()[order], "<u4"),
+        "temp_sum": _b64(cells["temp_sum"].to_numpy()[order], "<f4"),
+        "readings": _b64(cells["Readings"].to_numpy()[order], "<u4"),
+    }
+    nbytes = sum(len(data[k]) for k in ("day", "state", "count", "temp_sum", "readings"))
+    # The component keeps the user's brush and picks while the payload is unchanged.
+    data["digest"] = hashlib.sha1("".join(str(v) for v in data.values()).encode()).hexdigest()
+    return CrossfilterPayload(data, nbytes)
+
+
+def show_crossfilter(payload, sizes, slot=None):
+    """Render the component (into ``slot``, if given) and record its size in ``sizes``."""
+    sizes["crossfilter"] = payload.nbytes
+    with slot if slot is not None else nullcontext():
+        _component(payload=payload.data, key="crossfilter", default=None, height=COMPONENT_HEIGHT)
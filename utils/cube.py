@@ -0,0 +1,286 @@
+# utils/cube.py
+"""Pre-aggregated (State, day, temperature bucket) cube.
+
+Each cell stores the row count, the temperature sum/count and the latest
+``Start_Time`` of its rows. Cells are sorted by (state, day, bucket), so a
+filter is a per-state binary search on day plus a bucket range; KPIs and the
+linked charts are then sums over the selected cells. Only the (at most two)
+temperature buckets that the slider cuts through are recounted from rows via
+the ``FilterIndex``, which keeps every answer exact.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import CSV_PATH, data_version, load_accidents, load_manifest, stored_temp_range
+from utils.filters import load_filter_index
+from utils.parallel import map_rows
+
+BUCKET_WIDTH = 1.0  # °F per temperature bucket
+
+_NS_PER_DAY = 86_400 * 10**9
+_NAT = np.iinfo(np.int64).min
+_NULL_BUCKET = -1
+
+
+@dataclass
+class CubeResult:
+    """Aggregates for one filter selection."""
+
+    total: int
+    temp_sum: float
+    temp_count: int
+    latest: pd.Timestamp | None
+    by_state: pd.DataFrame  # State, Count (descending, non-zero only)
+    daily: pd.DataFrame  # Date, Accidents, Temperature(F) (mean), Readings (rows with a temperature)
+
+    @property
+    def temp_mean(self):
+        return self.temp_sum / self.temp_count if self.temp_count else None
+
+    @property
+    def unique_states(self):
+        return len(self.by_state)
+
+
+class AccidentCube:
+    """Sparse cube over the State, Start_Time and Temperature(F) columns."""
+
+    def __init__(self, state, start_time, temperature, index):
+        self.index = index
+        self.categories = list(pd.Categorical(state).categories)
+        self._codes = {name: code for code, name in enumerate(self.categories)}
+        codes = np.asarray(pd.Categorical(state, categories=self.categories).codes, dtype=np.int64)
+        times = pd.to_datetime(pd.Series(start_time)).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        temps = np.asarray(temperature, dtype=np.float64)
+
+        # Row-level columns, kept for recounting partially covered buckets.
+        self._row_state, self._row_time, self._row_temp = codes, times, temps
+        self._row_day = np.where(times == _NAT, _NAT, times // _NS_PER_DAY)
+
+        finite = temps[~np.isnan(temps)]
+        self.origin = float(np.floor(finite.min())) if len(finite) else 0.0
+        buckets = np.where(
+            np.isnan(temps), _NULL_BUCKET, np.floor((np.nan_to_num(temps) - self.origin) / BUCKET_WIDTH)
+        ).astype(np.int64)
+
+        rows = pd.DataFrame({
+            "state": codes, "day": self._row_day, "bucket": buckets,
+            "temp": temps, "time": times,
+        })[codes >= 0]
+        cells = rows.groupby(["state", "day", "bucket"], sort=True).agg(
+            count=("temp", "size"), temp_sum=("temp", "sum"), temp_count=("temp", "count"), max_time=("time", "max"),
+        ).reset_index()
+
+        self._state = cells["state"].to_numpy()
+        self._day = cells["day"].to_numpy()
+        self._bucket = cells["bucket"].to_numpy()
+        self._count = cells["count"].to_numpy(dtype=np.int64)
+        self._temp_sum = cells["temp_sum"].to_numpy(dtype=np.float64)
+        self._temp_count = cells["temp_count"].to_numpy(dtype=np.int64)
+        self._max_time = cells["max_time"].to_numpy(dtype=np.int64)
+        n_states = len(self.categories)
+        self._starts = np.searchsorted(self._state, np.arange(n_states), side="left")
+        self._ends = np.searchsorted(self._state, np.arange(n_states), side="right")
+
+    @classmethod
+    def from_frame(cls, df, index):
+        return cls(df["State"], df["Start_Time"], df["Temperature(F)"], index)
+
+    @property
+    def n_cells(self):
+        return len(self._count)
+
+    def _bucket_edges(self, temp_range):
+        """Return (first, stop) of the buckets fully inside ``temp_range``."""
+        lo, hi = temp_range
+        first = int(np.ceil((lo - self.origin) / BUCKET_WIDTH))
+        stop = int(np.floor((hi - self.origin) / BUCKET_WIDTH))
+        return max(first, 0), stop
+
+    def _select_cells(self, codes, temp_range, day_bounds):
+        first, stop = self._bucket_edges(temp_range) if temp_range is not None else (0, None)
+        parts = []
+        for code in codes:
+            lo, hi = self._starts[code], self._ends[code]
+            if day_bounds is not None:
+                lo, hi = lo + np.searchsorted(self._day[lo:hi], day_bounds, side="left")
+            bucket = self._bucket[lo:hi]
+            keep = bucket >= first if stop is None else (bucket >= first) & (bucket < stop)
+            if temp_range is None:
+                keep |= bucket == _NULL_BUCKET
+            parts.append(lo + np.flatnonzero(keep))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _edge_rows(self, states, temp_range, date_range):
+        """Row positions whose temperature falls in a partially covered bucket."""
+        lo, hi = temp_range
+        first, stop = self._bucket_edges(temp_range)
+        if first >= stop:
+            return self.index.select(states, temp_range, date_range)
+        low_edge = self.origin + first * BUCKET_WIDTH
+        high_edge = self.origin + stop * BUCKET_WIDTH
+        # The largest float32 below the edge: the index rounds bounds to float32 too.
+        below_edge = float(np.nextafter(np.float32(low_edge), np.float32(-np.inf)))
+        below = self.index.select(states, (lo, below_edge), date_range) if lo < low_edge else []
+        above = self.index.select(states, (high_edge, hi), date_range)
+        return np.concatenate([below, above]).astype(np.int64)
+
+    def _gather(self, states, temp_range=None, date_range=None):
+        # Selected cells plus the recounted edge rows, as ``summarize`` inputs.
+        # Bucket edges are compared with the bounds rounded like the stored temperatures.
+        temp_range = stored_temp_range(temp_range)
+        codes = sorted({self._codes[s] for s in states if s in self._codes})
+        day_bounds = None
+        if date_range is not None:
+            day_bounds = [
+                np.datetime64(date_range[0], "D").astype(np.int64),
+                np.datetime64(date_range[1], "D").astype(np.int64) + 1,
+            ]
+
+        cells = self._select_cells(codes, temp_range, day_bounds)
+        state = self._state[cells]
+        day = self._day[cells]
+        count = self._count[cells]
+        temp_sum = self._temp_sum[cells]
+        temp_count = self._temp_count[cells]
+        max_time = self._max_time[cells]
+
+        if temp_range is not None:
+            rows = self._edge_rows(states, temp_range, date_range)
+            state = np.concatenate([state, self._row_state[rows]])
+            day = np.concatenate([day, self._row_day[rows]])
+            count = np.concatenate([count, np.ones(len(rows), dtype=np.int64)])
+            temp_sum = np.concatenate([temp_sum, self._row_temp[rows]])
+            temp_count = np.concatenate([temp_count, np.ones(len(rows), dtype=np.int64)])
+            max_time = np.concatenate([max_time, self._row_time[rows]])
+
+        return self.categories, state, day, count, temp_sum, temp_count, max_time
+
+    def query(self, states, temp_range=None, date_range=None):
+        """Aggregate the rows matching the same predicates as ``FilterIndex.select``."""
+        return summarize(*self._gather(states, temp_range, date_range))
+
+    def cells(self, states, temp_range=None, date_range=None):
+        """Per (State, day) aggregates of the same rows as ``query`` (see ``group_cells``)."""
+        return group_cells(*self._gather(states, temp_range, date_range))
+
+
+def _partial(n_states, state, day, count, temp_sum, temp_count, max_time):
+    # Reductions of one row partition; merged by ``summarize``.
+    dated = day != _NAT
+    days, inverse = np.unique(day[dated], return_inverse=True)
+    valid_time = max_time[max_time != _NAT]
+    return (
+        np.bincount(state, weights=count, minlength=n_states),
+        days,
+        np.bincount(inverse, weights=count[dated], minlength=len(days)),
+        np.bincount(inverse, weights=temp_sum[dated], minlength=len(days)),
+        np.bincount(inverse, weights=temp_count[dated], minlength=len(days)),
+        count.sum(), temp_sum.sum(), temp_count.sum(),
+        valid_time.max() if len(valid_time) else _NAT,
+    )
+
+
+def summarize(categories, state, day, count, temp_sum, temp_count, max_time):
+    """Reduce cell (or single-row) aggregates to a ``CubeResult``.
+
+    ``state`` holds codes into ``categories``; ``day`` is days since epoch
+    and ``max_time`` nanoseconds since epoch, both with ``_NAT`` for missing.
+    Large inputs are reduced in row partitions on the aggregation pool.
+    """
+    parts = map_rows(
+        lambda rows: _partial(
+            len(categories), state[rows], day[rows], count[rows],
+            temp_sum[rows], temp_count[rows], max_time[rows],
+        ),
+        len(state),
+    )
+    by_state = np.sum([p[0] for p in parts], axis=0).astype(np.int64)
+    nonzero = np.flatnonzero(by_state)
+    state_counts = pd.DataFrame({
+        "State": [categories[c] for c in nonzero], "Count": by_state[nonzero],
+    }).sort_values("Count", ascending=False, kind="stable", ignore_index=True)
+
+    # Partitions may share days: merge their per-day sums on the union.
+    days, inverse = np.unique(np.concatenate([p[1] for p in parts]), return_inverse=True)
+    daily_count, daily_temp_sum, daily_temp_count = (
+        np.bincount(inverse, weights=np.concatenate([p[i] for p in parts]), minlength=len(days))
+        for i in (2, 3, 4)
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily_temp = daily_temp_sum / daily_temp_count
+    daily = pd.DataFrame({
+        "Date": days.astype("datetime64[D]").astype("datetime64[ns]"),
+        "Accidents": daily_count.astype(np.int64),
+        "Temperature(F)": daily_temp,
+        "Readings": daily_temp_count.astype(np.int64),
+    })
+
+    latest = max(p[8] for p in parts)
+    return CubeResult(
+        total=int(sum(p[5] for p in parts)),
+        temp_sum=float(sum(p[6] for p in parts)),
+        temp_count=int(sum(p[7] for p in parts)),
+        latest=pd.Timestamp(latest) if latest != _NAT else None,
+        by_state=state_counts,
+        daily=daily,
+    )
+
+
+def group_cells(categories, state, day, count, temp_sum, temp_count, max_time=None):
+    """Sum cell (or single-row) aggregates per (State, day).
+
+    Returns a frame with State, day (days since epoch, ``_NAT`` for rows
+    without a timestamp), Accidents, temp_sum and Readings, sorted by day.
+    Large inputs are grouped in row partitions and the partial groups summed.
+    """
+    def partial(rows):
+        return pd.DataFrame({
+            "state": state[rows], "day": day[rows], "Accidents": count[rows],
+            "temp_sum": temp_sum[rows], "Readings": temp_count[rows],
+        }).groupby(["day", "state"], sort=True).sum()
+
+    parts = map_rows(partial, len(state))
+    cells = parts[0] if len(parts) == 1 else pd.concat(parts).groupby(level=["day", "state"], sort=True).sum()
+    cells = cells.reset_index()
+    return pd.DataFrame({
+        "State": pd.Categorical.from_codes(cells["state"].to_numpy(), categories=categories),
+        "day": cells["day"].to_numpy(np.int64),
+        "Accidents": cells["Accidents"].to_numpy(np.int64),
+        "temp_sum": cells["temp_sum"].to_numpy(np.float64),
+        "Readings": cells["Readings"].to_numpy(np.int64),
+    })
+
+
+def row_cells(state, start_time, temperature):
+    """``summarize``/``group_cells`` inputs for rows that already match a filter, one cell per row."""
+    state = pd.Categorical(state)
+    codes = np.asarray(state.codes, dtype=np.int64)
+    times = pd.to_datetime(pd.Series(start_time)).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    temps = np.asarray(temperature, dtype=np.float64)
+    keep = codes >= 0
+    codes, times, temps = codes[keep], times[keep], temps[keep]
+    has_temp = ~np.isnan(temps)
+    return (
+        list(state.categories),
+        codes,
+        np.where(times == _NAT, _NAT, times // _NS_PER_DAY),
+        np.ones(len(codes), dtype=np.int64),
+        np.where(has_temp, temps, 0.0),
+        has_temp.astype(np.int64),
+        times,
+    )
+
+
+@st.cache_resource(max_entries=2)
+def _build_cube(csv_path, version):
+    df = load_accidents(["State", "Start_Time", "Temperature(F)"], csv_path)
+    return AccidentCube.from_frame(df, load_filter_index(csv_path))
+
+
+def load_cube(csv_path=CSV_PATH):
+    """Return the shared ``AccidentCube`` for the current dataset version."""
+    return _build_cube(str(csv_path), data_version(load_manifest(csv_path)))
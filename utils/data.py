@@ -0,0 +1,398 @@
+# utils/data.py
+"""Shared accidents data layer.
+
+The raw CSV is parsed once into a typed Parquet file under ``data/.cache``.
+That file is reused until the CSV changes. Columns read from it are held in
+``st.cache_resource`` one at a time, so every page and session shares the
+same column buffers and each page only loads the columns it renders.
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.metrics import tracked_cache
+from utils.shared import attach_column, load_layout, publish_columns, shared_dir
+
+# -----------------------------------------------------------
+# Locations
+# -----------------------------------------------------------
+# ACCIDENTS_CSV points the pages at another export (e.g. the synthetic load-test data).
+CSV_PATH = Path(os.environ.get("ACCIDENTS_CSV", "data/accidents_small.csv"))
+CACHE_DIR = Path("data/.cache")
+
+# CSVs at least this large are ingested in chunks (see utils.ingest).
+STREAMING_MIN_BYTES = 256 * 1024**2
+# Small row groups keep per-group Start_Time/Temperature statistics selective.
+ROW_GROUP_ROWS = 64_000
+# Bumped when the cached files or manifest change shape; older caches are rebuilt.
+MANIFEST_VERSION = 4
+
+# -----------------------------------------------------------
+# Schema
+# -----------------------------------------------------------
+# Compact dtypes for the US Accidents columns. Columns not listed here are
+# downcast generically by ``_compact_column``.
+SCHEMA = {
+    "ID": "string",
+    "Source": "category",
+    "Severity": "Int8",
+    "Start_Time": "datetime64[ns]",
+    "Start_Day": "Int32",  # days since 1970-01-01, derived at ingest
+    "Start_Hour": "Int8",
+    "Start_Weekday": "Int8",  # Monday = 0
+    "End_Time": "datetime64[ns]",
+    "Start_Lat": "float32",
+    "Start_Lng": "float32",
+    "End_Lat": "float32",
+    "End_Lng": "float32",
+    "Distance(mi)": "float32",
+    "Street": "category",
+    "City": "category",
+    "County": "category",
+    "State": "category",
+    "Zipcode": "category",
+    "Country": "category",
+    "Timezone": "category",
+    "Airport_Code": "category",
+    "Temperature(F)": "float32",
+    "Wind_Chill(F)": "float32",
+    "Humidity(%)": "float32",
+    "Pressure(in)": "float32",
+    "Visibility(mi)": "float32",
+    "Wind_Direction": "category",
+    "Wind_Speed(mph)": "float32",
+    "Precipitation(in)": "float32",
+    "Weather_Condition": "category",
+    "Sunrise_Sunset": "category",
+    "Civil_Twilight": "category",
+    "Nautical_Twilight": "category",
+    "Astronomical_Twilight": "category",
+}
+
+# Strings with at most this share of distinct values become categoricals.
+CATEGORY_MAX_RATIO = 0.5
+
+# Timestamp layouts seen in the US Accidents exports, keyed by string length.
+# ``{sep}`` is the date/time separator found in the value (" " or "T").
+TIMESTAMP_FORMATS = {
+    10: "%Y-%m-%d",
+    16: "%Y-%m-%d{sep}%H:%M",
+    19: "%Y-%m-%d{sep}%H:%M:%S",
+}
+FRACTIONAL_FORMAT = "%Y-%m-%d{sep}%H:%M:%S.%f"
+
+
+def columnar_paths(csv_path):
+    """Return the (parquet, manifest) paths cached for ``csv_path``."""
+    return CACHE_DIR / f"{csv_path.stem}.parquet", CACHE_DIR / f"{csv_path.stem}.json"
+
+
+def csv_fingerprint(csv_path=CSV_PATH):
+    """Cheap change detector for the source CSV (size + mtime)."""
+    stat = Path(csv_path).stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+# -----------------------------------------------------------
+# CSV -> columnar ingest
+# -----------------------------------------------------------
+def _compact_column(series):
+    """Downcast a column that has no declared dtype."""
+    if pd.api.types.is_float_dtype(series):
+        return series.astype("float32")
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if series.nunique() <= CATEGORY_MAX_RATIO * max(len(series), 1):
+        return series.astype("category")
+    return series
+
+
+def parse_timestamps(values):
+    """Parse timestamp strings one detected format at a time.
+
+    Values are grouped by layout (length, separator, fractional seconds) and
+    each group is parsed with an explicit format, which keeps pandas on its
+    fast path when layouts are mixed. Returns ``(parsed, stats)`` where
+    ``stats`` counts the values per format and the non-null values that
+    could not be parsed.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, {"formats": {}, "failures": 0}
+
+    text = values.astype("string")
+    length = text.str.len().fillna(0).astype("int64")
+    sep = text.str[10:11].fillna("")
+    fractional = (text.str[19:20].fillna("") == ".") & (length > 20)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    matched = pd.Series(False, index=values.index)
+    formats = {}
+
+    groups = [(fmt, length == n) for n, fmt in TIMESTAMP_FORMATS.items()] + [(FRACTIONAL_FORMAT, fractional)]
+    for template, mask in groups:
+        for separator in (" ", "T"):
+            group = mask & (sep == separator) if "{sep}" in template else mask
+            if not group.any():
+                continue
+            fmt = template.format(sep=separator)
+            parsed[group] = pd.to_datetime(text[group], format=fmt, errors="coerce")
+            matched |= group
+            formats[fmt] = int(group.sum())
+            if "{sep}" not in template:
+                break
+
+    # Anything else (time zones, odd layouts) gets one ISO8601 attempt.
+    rest = ~matched & text.notna().to_numpy(dtype=bool)
+    if rest.any():
+        parsed[rest] = pd.to_datetime(text[rest], format="ISO8601", errors="coerce", utc=True).dt.tz_localize(None)
+        formats["other"] = int(rest.sum())
+
+    failures = int((text.notna() & parsed.isna()).sum())
+    return parsed, {"formats": formats, "failures": failures}
+
+
+def add_time_parts(df, column="Start_Time"):
+    """Add integer day / hour / weekday columns derived from ``column``."""
+    prefix = column.removesuffix("_Time")
+    times = df[column]
+    days = times.to_numpy(dtype="datetime64[D]").astype("int64")
+    df[f"{prefix}_Day"] = pd.Series(days, index=df.index).mask(times.isna()).astype("Int32")
+    df[f"{prefix}_Hour"] = times.dt.hour.astype("Int8")
+    df[f"{prefix}_Weekday"] = times.dt.weekday.astype("Int8")
+    return df
+
+
+def coerce_types(df, report=None):
+    """Convert a raw accidents frame to the compact schema, column by column.
+
+    Timestamp parse statistics are stored in ``report`` (keyed by column)
+    when a dict is given.
+    """
+    for col in list(df.columns):
+        dtype = SCHEMA.get(col)
+        if dtype is None:
+            df[col] = _compact_column(df[col])
+        elif dtype.startswith("datetime64"):
+            df[col], stats = parse_timestamps(df[col])
+            if report is not None:
+                report[col] = stats
+        elif dtype.startswith(("Int", "float")):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    if "Start_Time" in df.columns:
+        add_time_parts(df)
+    return df
+
+
+def frame_domain(df):
+    """Filter bounds recorded in the manifest: state list, temperature and time range."""
+    temps = df["Temperature(F)"] if "Temperature(F)" in df.columns else pd.Series(dtype="float32")
+    times = df["Start_Time"] if "Start_Time" in df.columns else pd.Series(dtype="datetime64[ns]")
+    return {
+        "states": sorted(df["State"].dropna().unique()) if "State" in df.columns else [],
+        "temp_min": None if temps.isna().all() else float(temps.min()),
+        "temp_max": None if temps.isna().all() else float(temps.max()),
+        "time_min": None if times.isna().all() else times.min().isoformat(),
+        "time_max": None if times.isna().all() else times.max().isoformat(),
+    }
+
+
+def stored_temp_range(temp_range):
+    """``temp_range`` rounded to the float32 the Temperature(F) column is stored in.
+
+    A slider bound such as 104.6 lies just above the stored float32 104.6, so
+    comparing the column against it in float64 would drop that row. Every
+    engine filters on the rounded bounds (``None`` passes through).
+    """
+    if temp_range is None:
+        return None
+    return tuple(float(np.float32(t)) for t in temp_range)
+
+
+def build_columnar(csv_path=CSV_PATH):
+    """Parse ``csv_path`` and write its typed Parquet copy; return the parquet path."""
+    csv_path = Path(csv_path)
+    parquet_path, manifest_path = columnar_paths(csv_path)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    df = pd.read_csv(csv_path)
+    # Default-dtype footprint, kept so pages can report what the schema saves.
+    raw_bytes = {col: int(n) for col, n in df.memory_usage(deep=True, index=False).items()}
+    timestamps = {}
+    df = coerce_types(df, timestamps)
+    if {"State", "Start_Time"} <= set(df.columns):
+        # Contiguous per-state blocks with sorted timestamps (see utils.filters).
+        df = df.sort_values(["State", "Start_Time"], na_position="last", kind="stable", ignore_index=True)
+    df.to_parquet(parquet_path, index=False, row_group_size=ROW_GROUP_ROWS)
+    # Fixed-width columns are also published as memory-mapped buffers that
+    # every server process attaches to instead of loading its own copy.
+    shared = publish_columns(df, shared_dir(parquet_path))
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "source": str(csv_path),
+        "fingerprint": csv_fingerprint(csv_path),
+        "parquet": str(parquet_path),
+        "rows": len(df),
+        "columns": list(df.columns),
+        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+        "raw_bytes": raw_bytes,
+        "timestamps": timestamps,
+        "domain": frame_domain(df),
+        "shared_columns": sorted(shared),
+        "refreshed": datetime.now().isoformat(timespec="seconds"),
+        "revision": 0,
+        "domain_revision": 0,
+        "partitions": {},
+        "appends": [],
+    }
+    manifest["watermark"] = manifest["domain"]["time_max"]
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return parquet_path
+
+
+def ensure_columnar(csv_path=CSV_PATH):
+    """Return the Parquet path for ``csv_path``, rebuilding it only if the CSV changed.
+
+    CSVs of ``STREAMING_MIN_BYTES`` or more go through the chunked ingest in
+    ``utils.ingest`` and come back as a partitioned dataset directory. Files
+    appended with ``utils.ingest.append_ingest`` are appended again after a
+    rebuild, as long as they still exist.
+    """
+    csv_path = Path(csv_path)
+    manifest_path = columnar_paths(csv_path)[1]
+    appended = []
+    try:
+        manifest = json.loads(manifest_path.read_text())
+        current = (
+            manifest.get("version") == MANIFEST_VERSION
+            and manifest.get("fingerprint") == csv_fingerprint(csv_path)
+        )
+        if current and Path(manifest["parquet"]).exists():
+            return Path(manifest["parquet"])
+        appended = [Path(a["source"]) for a in manifest.get("appends", []) if Path(a["source"]).exists()]
+    except (OSError, ValueError, KeyError):
+        pass
+    if appended or csv_path.stat().st_size >= STREAMING_MIN_BYTES:
+        from utils.ingest import append_ingest, stream_ingest
+
+        dataset_dir = stream_ingest(csv_path)
+        for source in appended:
+            append_ingest(source, csv_path)
+        return dataset_dir
+    return build_columnar(csv_path)
+
+
+# -----------------------------------------------------------
+# Shared in-memory columns
+# -----------------------------------------------------------
+@tracked_cache("load_manifest", st.cache_resource(max_entries=2))
+def _load_manifest(csv_path, fingerprint, manifest_mtime):
+    # Both arguments are only part of the cache key: a changed CSV or an
+    # append (which rewrites the manifest) gets a new entry.
+    ensure_columnar(Path(csv_path))
+    return json.loads(columnar_paths(Path(csv_path))[1].read_text())
+
+
+@st.cache_resource(max_entries=4)
+def _shared_layout(parquet_path, version):
+    return load_layout(shared_dir(parquet_path))
+
+
+@tracked_cache("load_column", st.cache_resource(max_entries=128, show_spinner="Loading accidents data..."))
+def _load_column(parquet_path, version, column):
+    # ``version`` (``data_version``) is only part of the cache key: an append
+    # bumps the revision, so columns are reloaded rather than served stale.
+    spec = _shared_layout(parquet_path, version).get(column)
+    if spec is not None:
+        # Read-only view of the node-wide mapped buffers: no per-process copy.
+        return attach_column(shared_dir(parquet_path), column, spec)
+    return pd.read_parquet(parquet_path, columns=[column])[column]
+
+
+def load_manifest(csv_path=CSV_PATH):
+    """Return the ingest manifest (rows, columns, dtypes, raw sizes) for ``csv_path``."""
+    try:
+        manifest_mtime = columnar_paths(Path(csv_path))[1].stat().st_mtime_ns
+    except OSError:
+        manifest_mtime = None
+    return _load_manifest(str(csv_path), csv_fingerprint(csv_path), manifest_mtime)
+
+
+def data_version(manifest):
+    """Cache key for everything read from the dataset: source CSV plus append revision."""
+    return f"{manifest['fingerprint']}.r{manifest['revision']}"
+
+
+def dataset_files(manifest):
+    """Parquet files of a partitioned dataset published by ``manifest``.
+
+    An append writes its ``append-<revision>-*`` files before the manifest
+    names that revision; until then (or if the append fails) they are skipped.
+    """
+    files = []
+    for path in sorted(Path(manifest["parquet"]).glob("*=*/*=*/*.parquet")):  # State=/year= only
+        if path.name.startswith("append-") and int(path.name.split("-")[1]) > manifest["revision"]:
+            continue
+        files.append(str(path))
+    return files
+
+
+def load_accidents(columns=None, csv_path=CSV_PATH):
+    """Return the shared accidents frame projected to ``columns`` (all by default).
+
+    The returned frame wraps the cached column buffers without copying them,
+    so treat it as read-only.
+    """
+    manifest = load_manifest(csv_path)
+    columns = manifest["columns"] if columns is None else columns
+    return pd.DataFrame(
+        {col: _load_column(manifest["parquet"], data_version(manifest), col) for col in columns},
+        copy=False,
+    )
+
+
+@tracked_cache("column_array", st.cache_resource(max_entries=128))
+def _column_array(parquet_path, version, column):
+    series = _load_column(parquet_path, version, column)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # ``.array.codes`` is a view; ``.cat.codes`` would copy.
+        return np.asarray(series.array.codes)
+    if pd.api.types.is_extension_array_dtype(series.dtype) and pd.api.types.is_numeric_dtype(series.dtype):
+        # Nullable ints: unmask once, with 0 in the null slots.
+        return series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+    return series.to_numpy()
+
+
+def column_array(column, csv_path=CSV_PATH):
+    """Return ``column`` as a shared NumPy array (category codes for categoricals).
+
+    Null slots hold a placeholder: NaN for floats, 0 for nullable ints, -1 for codes.
+    """
+    manifest = load_manifest(csv_path)
+    return _column_array(manifest["parquet"], data_version(manifest), column)
+
+
+def memory_report(df, csv_path=CSV_PATH):
+    """Compare the in-memory size of ``df`` with the same columns at default CSV dtypes."""
+    raw_bytes = load_manifest(csv_path)["raw_bytes"]
+    compact = int(df.memory_usage(deep=True, index=False).sum())
+    raw = sum(raw_bytes.get(col, 0) for col in df.columns)
+    return {"compact_bytes": compact, "raw_bytes": raw, "saved_bytes": max(raw - compact, 0)}
+
+
+@st.cache_resource(max_entries=4)
+def _memory_report(csv_path, version, columns):
+    return memory_report(load_accidents(list(columns), csv_path), csv_path)
+
+
+def load_memory_report(columns, csv_path=CSV_PATH):
+    """``memory_report`` of the shared frame projected to ``columns``, computed once per data version."""
+    return _memory_report(str(csv_path), data_version(load_manifest(csv_path)), tuple(columns))
@@ -0,0 +1,172 @@
+# utils/figures.py
+"""Compact Plotly figures for the Gallery and the Dashboard.
+
+Figures are built directly with ``plotly.graph_objects`` on a shared layout
+template instead of through Plotly Express, and every numeric array is
+handed over as a compact NumPy array (float32/int32, dates as epoch
+milliseconds) so Plotly serializes it as a base64 typed array rather than a
+JSON list. Labels and hover text are drawn from the numbers with
+``texttemplate``/``hovertemplate`` instead of shipping per-point strings.
+
+``chart_payload`` serializes a figure once and keys it by content hash:
+identical charts from different selections share one cached JSON string, and
+``nbytes`` is what the browser receives for it. Only the JSON is kept, so a
+cached chart costs its payload size rather than a live ``go.Figure``.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+from utils.metrics import stage
+
+MAP_STYLE = "open-street-map"
+COLOR_SCALE = "Viridis"
+
+BASE_LAYOUT = go.Layout(
+    margin={"l": 0, "r": 0, "t": 40, "b": 0},
+    hovermode="closest",
+    showlegend=False,
+)
+
+
+@dataclass
+class ChartPayload:
+    """A figure's serialized JSON with its size and hash."""
+
+    spec: str
+    nbytes: int
+    digest: str
+
+
+def chart_payload(fig, cache=None):
+    """Serialize ``fig`` once; with ``cache``, reuse an identical earlier payload."""
+    with stage("serialize") as timing:
+        spec = pio.to_json(fig, validate=False)
+        timing["bytes"] = len(spec)
+    payload = ChartPayload(spec, len(spec), hashlib.sha1(spec.encode()).hexdigest())
+    if cache is None:
+        return payload
+    return cache.get_or_compute(("chart_json", payload.digest), lambda: payload)
+
+
+def show_chart(name, payload, sizes, slot=None):
+    """Render a ``ChartPayload`` (into ``slot``, if given) and record its size under ``name`` in ``sizes``."""
+    sizes[name] = payload.nbytes
+    # The spec came out of a validated figure: rebuild it without re-validating
+    # (a plain dict would be validated again by st.plotly_chart, ~8 ms per chart).
+    (slot or st).plotly_chart(go.Figure(json.loads(payload.spec), _validate=False), width="stretch")
+
+
+def payload_caption(sizes):
+    """One-line summary of the bytes sent per chart."""
+    parts = " · ".join(f"{name} {n / 1024:,.1f} KB" for name, n in sizes.items())
+    return f"Chart payload: {sum(sizes.values()) / 1024:,.1f} KB ({parts})"
+
+
+def _f32(values):
+    return np.ascontiguousarray(values, dtype=np.float32)
+
+
+def _i32(values):
+    return np.ascontiguousarray(values, dtype=np.int32)
+
+
+def _epoch_ms(dates):
+    # Plotly date axes accept milliseconds since epoch, which encode as a typed array.
+    return pd.to_datetime(pd.Series(dates)).to_numpy(dtype="datetime64[ms]").astype(np.float64)
+
+
+def _figure(traces, title, **layout):
+    fig = go.Figure(data=traces, layout=BASE_LAYOUT)
+    fig.update_layout(title=title, **layout)
+    return fig
+
+
+def state_bar(by_state, title, horizontal=False):
+    """Accidents per state from a ``CubeResult.by_state`` frame.
+
+    An ``Error`` column (estimates, see ``utils.approx``) is drawn as error bars.
+    """
+    states, counts = by_state["State"].astype(str).tolist(), _i32(by_state["Count"])
+    if horizontal:
+        trace = go.Bar(x=counts, y=states, orientation="h", texttemplate="%{x:,}",
+                       hovertemplate="%{y}: %{x:,} accidents<extra></extra>")
+        axes = {"xaxis_title": "Number of Accidents", "yaxis": {"title": "State", "categoryorder": "total ascending"}}
+    else:
+        trace = go.Bar(x=states, y=counts, texttemplate="%{y:,}",
+                       hovertemplate="%{x}: %{y:,} accidents<extra></extra>")
+        axes = {"xaxis_title": "State", "yaxis_title": "Count"}
+    if "Error" in by_state:
+        trace.update({"error_x" if horizontal else "error_y": {"type": "data", "array": _f32(by_state["Error"])}})
+    return _figure([trace], title, **axes)
+
+
+def histogram_bars(edges, counts, title):
+    """Bar trace of precomputed bin counts (see ``utils.hist``)."""
+    edges = np.asarray(edges, dtype=np.float64)
+    trace = go.Bar(
+        x=_f32((edges[:-1] + edges[1:]) / 2),
+        y=_i32(counts),
+        width=_f32(np.diff(edges)),
+        customdata=_f32(np.column_stack([edges[:-1], edges[1:]])),
+        hovertemplate="%{customdata[0]:.1f} – %{customdata[1]:.1f} °F: %{y:,}<extra></extra>",
+    )
+    return _figure([trace], title, bargap=0, xaxis_title="Temperature (°F)", yaxis_title="count")
+
+
+def time_line(dates, values, title, y_title, value_format=",.0f"):
+    """Line over a date axis."""
+    trace = go.Scatter(
+        x=_epoch_ms(dates), y=_f32(values), mode="lines",
+        hovertemplate=f"%{{x|%Y-%m-%d}}: %{{y:{value_format}}}<extra></extra>",
+    )
+    return _figure([trace], title, xaxis={"type": "date", "title": "Date"}, yaxis_title=y_title)
+
+
+def _map(trace):
+    return _figure([trace], None, mapbox={"style": MAP_STYLE, "zoom": 3, "center": {"lat": 38, "lon": -96}},
+                   margin={"l": 0, "r": 0, "t": 0, "b": 0})
+
+
+def density_map(cells, size_max=15):
+    """Grid cells from a ``GeoResult``: marker area by count, color by mean temperature."""
+    counts = cells["Accidents"].to_numpy(dtype=np.float64)
+    temps = _f32(cells["Temperature(F)"])
+    return _map(go.Scattermapbox(
+        lat=_f32(cells["Lat"]),
+        lon=_f32(cells["Lng"]),
+        mode="markers",
+        marker={
+            "size": _f32(counts),
+            "sizemode": "area",
+            "sizeref": 2.0 * counts.max() / size_max**2 if len(counts) else 1.0,
+            "color": temps,
+            "colorscale": COLOR_SCALE,
+            "colorbar": {"title": "Mean Temperature (°F)"},
+        },
+        # Per-point attributes are available to hovertemplate, so no customdata copy.
+        hovertemplate="Accidents: %{marker.size:,}<br>Mean Temperature: %{marker.color:.1f} °F<extra></extra>",
+    ))
+
+
+def points_map(points):
+    """Individual accidents; only used below ``geo.RAW_POINT_LIMIT`` points."""
+    temps = _f32(points["Temperature(F)"])
+    labels = (
+        points["City"].astype(str) + ", " + points["State"].astype(str) + "<br>"
+        + points["Start_Time"].dt.strftime("%Y-%m-%d %H:%M").fillna("unknown time")
+    )
+    return _map(go.Scattermapbox(
+        lat=_f32(points["Start_Lat"]),
+        lon=_f32(points["Start_Lng"]),
+        mode="markers",
+        marker={"color": temps, "colorscale": COLOR_SCALE, "colorbar": {"title": "Temperature (°F)"}},
+        text=labels.tolist(),
+        hovertemplate="%{text}<br>Temperature: %{marker.color:.1f} °F<extra></extra>",
+    ))
@@ -0,0 +1,127 @@
+# utils/filters.py
+"""Indexed State / Temperature / Date filtering.
+
+``FilterIndex`` is built once per dataset. Rows are ordered by
+(State, Start_Time) so every state is one contiguous block whose valid
+timestamps are sorted; date ranges become two binary searches inside that
+block. Each state also keeps its non-null temperatures sorted, so a
+temperature cut is a binary search too. ``select`` returns row positions
+and only touches the rows of the selected states that survive the narrower
+of the two predicates.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import CSV_PATH, data_version, load_accidents, load_manifest, stored_temp_range
+
+_NS_PER_DAY = 86_400 * 10**9
+_NAT = np.iinfo(np.int64).min
+_MAX = np.iinfo(np.int64).max
+
+
+class FilterIndex:
+    """Row-offset index over the State, Start_Time and Temperature(F) columns."""
+
+    def __init__(self, state, start_time, temperature):
+        state = pd.Categorical(state)
+        codes = np.asarray(state.codes, dtype=np.int64)
+        times = pd.to_datetime(pd.Series(start_time)).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        temps = np.asarray(temperature, dtype=np.float64)
+        n = len(codes)
+
+        # Order rows by (state, time); NaT sorts last and null states (-1) go to the end.
+        nat = times == _NAT
+        codes = np.where(codes < 0, _MAX, codes)
+        order = np.lexsort((np.where(nat, _MAX, times), codes))
+        self._order = None if np.array_equal(order, np.arange(n)) else order
+        if self._order is not None:
+            codes, times, temps, nat = codes[order], times[order], temps[order], nat[order]
+
+        self.categories = list(state.categories)
+        self._codes = {name: code for code, name in enumerate(self.categories)}
+        self._starts = np.searchsorted(codes, np.arange(len(self.categories)), side="left")
+        self._ends = np.searchsorted(codes, np.arange(len(self.categories)), side="right")
+        # Valid timestamps of a state block are [start, time_end); NaT rows follow.
+        self._times = times
+        self._time_ends = np.array(
+            [s + np.count_nonzero(~nat[s:e]) for s, e in zip(self._starts, self._ends)], dtype=np.int64
+        )
+
+        # Per-state sorted non-null temperatures and their (sorted-order) positions.
+        self._temps = temps
+        temp_positions, temp_values, temp_offsets = [], [], [0]
+        for s, e in zip(self._starts, self._ends):
+            block = temps[s:e]
+            keep = np.flatnonzero(~np.isnan(block))
+            by_temp = keep[np.argsort(block[keep], kind="stable")]
+            temp_positions.append(by_temp + s)
+            temp_values.append(block[by_temp])
+            temp_offsets.append(temp_offsets[-1] + len(by_temp))
+        self._temp_positions = np.concatenate(temp_positions) if temp_positions else np.empty(0, np.int64)
+        self._temp_values = np.concatenate(temp_values) if temp_values else np.empty(0)
+        self._temp_offsets = np.asarray(temp_offsets, dtype=np.int64)
+
+        self.states = [c for c, s, e in zip(self.categories, self._starts, self._ends) if e > s]
+        self.temp_min = float(self._temp_values.min()) if len(self._temp_values) else None
+        self.temp_max = float(self._temp_values.max()) if len(self._temp_values) else None
+        valid = times[~nat]
+        self.time_min = pd.Timestamp(valid.min()) if len(valid) else None
+        self.time_max = pd.Timestamp(valid.max()) if len(valid) else None
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df["State"], df["Start_Time"], df["Temperature(F)"])
+
+    def _state_select(self, code, temp_range, time_bounds):
+        lo, hi = self._starts[code], self._ends[code]
+        if time_bounds is not None:
+            t0, t1 = time_bounds
+            block_end = self._time_ends[code]
+            lo, hi = lo + np.searchsorted(self._times[lo:block_end], [t0, t1], side="left")
+        if hi <= lo or temp_range is None:
+            return np.arange(lo, hi)
+
+        t_lo, t_hi = self._temp_offsets[code], self._temp_offsets[code + 1]
+        values = self._temp_values[t_lo:t_hi]
+        c_lo = t_lo + np.searchsorted(values, temp_range[0], side="left")
+        c_hi = t_lo + np.searchsorted(values, temp_range[1], side="right")
+        if c_hi - c_lo < hi - lo:
+            # Fewer temperature candidates than rows in the date slice.
+            candidates = self._temp_positions[c_lo:c_hi]
+            return np.sort(candidates[(candidates >= lo) & (candidates < hi)])
+        block = self._temps[lo:hi]
+        return lo + np.flatnonzero((block >= temp_range[0]) & (block <= temp_range[1]))
+
+    def select(self, states, temp_range=None, date_range=None):
+        """Return sorted row positions matching all given predicates.
+
+        ``temp_range`` is an inclusive (low, high) in °F and drops null
+        temperatures, like ``Series.between`` on the float32 column.
+        ``date_range`` is an inclusive (start_date, end_date) pair and drops
+        null timestamps.
+        """
+        temp_range = stored_temp_range(temp_range)
+        time_bounds = None
+        if date_range is not None:
+            start, end = date_range
+            t0 = np.datetime64(start, "D").astype("datetime64[ns]").view(np.int64)
+            t1 = np.datetime64(end, "D").astype("datetime64[ns]").view(np.int64) + _NS_PER_DAY
+            time_bounds = (t0, t1)
+
+        codes = sorted(self._codes[s] for s in set(states) if s in self._codes)
+        parts = [self._state_select(code, temp_range, time_bounds) for code in codes]
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        if self._order is not None:
+            rows = np.sort(self._order[rows])
+        return rows.astype(np.int64, copy=False)
+
+
+@st.cache_resource(max_entries=2)
+def _build_index(csv_path, version):
+    return FilterIndex.from_frame(load_accidents(["State", "Start_Time", "Temperature(F)"], csv_path))
+
+
+def load_filter_index(csv_path=CSV_PATH):
+    """Return the shared ``FilterIndex`` for the current dataset version."""
+    return _build_index(str(csv_path), data_version(load_manifest(csv_path)))
@@ -0,0 +1,174 @@
+# utils/geo.py
+"""Square-grid aggregation of accident locations.
+
+A pyramid of grids (coarse to fine cell sizes in degrees) is precomputed per
+state over the rows the Gallery can show, so the default map is answered by
+summing a few thousand cells instead of shipping individual points. When the
+temperature slider cuts the range, the filtered rows are binned on the fly
+with the same grid. The finest level that fits ``MAX_CELLS`` is used.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import CSV_PATH, data_version, load_accidents, load_manifest, stored_temp_range
+from utils.filters import load_filter_index
+from utils.parallel import map_rows
+
+CELL_SIZES = (2.0, 1.0, 0.5, 0.25, 0.1, 0.05)  # degrees, coarse to fine
+MAX_CELLS = 1500  # upper bound on markers sent to the browser
+RAW_POINT_LIMIT = 1000  # below this many points, render them individually
+
+_ROWS = int(np.ceil(180 / min(CELL_SIZES))) + 1  # grid rows at the finest level
+_SPAN = 4 * _ROWS * _ROWS  # exceeds every cell key, so state * _SPAN + cell is unique
+
+
+@dataclass
+class GeoResult:
+    """Grid cells for one selection."""
+
+    cell_size: float
+    n_points: int
+    cells: pd.DataFrame  # Lat, Lng (cell centers), Accidents, Temperature(F) (mean)
+
+
+def _cell_keys(lat, lng, size):
+    gx = np.floor((lng + 180.0) / size).astype(np.int64)
+    gy = np.floor((lat + 90.0) / size).astype(np.int64)
+    return gx * _ROWS + gy
+
+
+def _aggregate(keys, count, temp_sum):
+    """Sum ``count``/``temp_sum`` per distinct cell key."""
+    cells, inverse = np.unique(keys, return_inverse=True)
+    return (
+        cells,
+        np.bincount(inverse, weights=count, minlength=len(cells)),
+        np.bincount(inverse, weights=temp_sum, minlength=len(cells)),
+    )
+
+
+def _cells_frame(size, cells, count, temp_sum):
+    gx, gy = np.divmod(cells, _ROWS)
+    return pd.DataFrame({
+        "Lat": (gy + 0.5) * size - 90.0,
+        "Lng": (gx + 0.5) * size - 180.0,
+        "Accidents": count.astype(np.int64),
+        "Temperature(F)": temp_sum / np.maximum(count, 1),
+    })
+
+
+class GeoPyramid:
+    """Per-state grid aggregates at every level in ``CELL_SIZES``."""
+
+    def __init__(self, state, lat, lng, temperature, index):
+        self.index = index
+        self.categories = list(pd.Categorical(state).categories)
+        self._codes = {name: code for code, name in enumerate(self.categories)}
+        codes = np.asarray(pd.Categorical(state, categories=self.categories).codes, dtype=np.int64)
+        self._lat = np.asarray(lat, dtype=np.float64)
+        self._lng = np.asarray(lng, dtype=np.float64)
+        self._temp = np.asarray(temperature, dtype=np.float64)
+
+        # Same rows the Gallery filter can return: known state, location and temperature.
+        keep = (codes >= 0) & ~np.isnan(self._lat) & ~np.isnan(self._lng) & ~np.isnan(self._temp)
+        codes, lat, lng, temp = codes[keep], self._lat[keep], self._lng[keep], self._temp[keep]
+
+        self._levels = []
+        for size in CELL_SIZES:
+            # Combined (state, cell) key keeps each state's cells contiguous after np.unique.
+            keys = codes * _SPAN + _cell_keys(lat, lng, size)
+            combined, count, temp_sum = _aggregate(keys, np.ones(len(keys)), temp)
+            state_of_cell = combined // _SPAN
+            self._levels.append({
+                "cells": combined % _SPAN,
+                "count": count,
+                "temp_sum": temp_sum,
+                "starts": np.searchsorted(state_of_cell, np.arange(len(self.categories)), side="left"),
+                "ends": np.searchsorted(state_of_cell, np.arange(len(self.categories)), side="right"),
+            })
+
+    @classmethod
+    def from_frame(cls, df, index):
+        return cls(df["State"], df["Start_Lat"], df["Start_Lng"], df["Temperature(F)"], index)
+
+    def _full_range(self, temp_range):
+        temp_range = stored_temp_range(temp_range)
+        return (
+            temp_range is None
+            or self.index.temp_min is None
+            or (temp_range[0] <= self.index.temp_min and temp_range[1] >= self.index.temp_max)
+        )
+
+    def points(self, states, temp_range=None):
+        """Row positions of the located points matching the Gallery filter."""
+        rows = self.index.select(states, temp_range)
+        return rows[~np.isnan(self._lat[rows]) & ~np.isnan(self._lng[rows])]
+
+    def query(self, states, temp_range=None, max_cells=MAX_CELLS):
+        """Return the finest grid for the selection with at most ``max_cells`` cells."""
+        codes = sorted({self._codes[s] for s in states if s in self._codes})
+        if self._full_range(temp_range):
+            def level_cells(i):
+                level = self._levels[i]
+                parts = [slice(level["starts"][c], level["ends"][c]) for c in codes]
+                if not parts:
+                    return np.empty(0, np.int64), np.empty(0), np.empty(0)
+                return _aggregate(
+                    np.concatenate([level["cells"][p] for p in parts]),
+                    np.concatenate([level["count"][p] for p in parts]),
+                    np.concatenate([level["temp_sum"][p] for p in parts]),
+                )
+
+            return _finest(level_cells, max_cells)
+
+        rows = self.points(states, temp_range)
+        return bin_points(self._lat[rows], self._lng[rows], self._temp[rows], max_cells)
+
+
+def _finest(level_cells, max_cells):
+    """Walk the levels coarse to fine and keep the finest one under budget."""
+    chosen, result = 0, level_cells(0)
+    for i in range(1, len(CELL_SIZES)):
+        finer = level_cells(i)
+        if len(finer[0]) > max_cells:
+            break
+        chosen, result = i, finer
+    cells, count, temp_sum = result
+    return GeoResult(
+        cell_size=CELL_SIZES[chosen],
+        n_points=int(count.sum()),
+        cells=_cells_frame(CELL_SIZES[chosen], cells, count, temp_sum),
+    )
+
+
+def bin_points(lat, lng, temperature, max_cells=MAX_CELLS):
+    """Grid already-filtered points (non-null location and temperature) on the fly."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    temp = np.asarray(temperature, dtype=np.float64)
+
+    def level_cells(i):
+        # Grid each row partition, then merge the partial cells on their keys.
+        def partial(rows):
+            return _aggregate(_cell_keys(lat[rows], lng[rows], CELL_SIZES[i]), np.ones(len(temp[rows])), temp[rows])
+
+        parts = map_rows(partial, len(lat))
+        if len(parts) == 1:
+            return parts[0]
+        return _aggregate(*(np.concatenate([p[j] for p in parts]) for j in range(3)))
+
+    return _finest(level_cells, max_cells)
+
+
+@st.cache_resource(max_entries=2)
+def _build_pyramid(csv_path, version):
+    df = load_accidents(["State", "Start_Lat", "Start_Lng", "Temperature(F)"], csv_path)
+    return GeoPyramid.from_frame(df, load_filter_index(csv_path))
+
+
+def load_geo_pyramid(csv_path=CSV_PATH):
+    """Return the shared ``GeoPyramid`` for the current dataset version."""
+    return _build_pyramid(str(csv_path), data_version(load_manifest(csv_path)))
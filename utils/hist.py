@@ -0,0 +1,100 @@
+# utils/hist.py
+"""Server-side temperature histogram.
+
+Bins have fixed edges over the global ``Temperature(F)`` range, so a
+histogram is a short vector of counts. Per-state counts are precomputed once;
+a selection sums the vectors of its states, and only the (at most two) bins
+that the temperature slider cuts through are recounted from rows via the
+``FilterIndex``. The Gallery draws the counts as a bar trace, so the figure
+carries O(bins) values instead of one per accident.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data import CSV_PATH, data_version, load_accidents, load_manifest, stored_temp_range
+from utils.filters import load_filter_index
+from utils.parallel import map_rows
+
+HIST_BINS = 30
+
+
+def histogram_edges(temp_min, temp_max, bins=HIST_BINS):
+    """``bins + 1`` evenly spaced edges over the global temperature range."""
+    if temp_min is None:
+        temp_min = temp_max = 0.0
+    if temp_max <= temp_min:
+        temp_max = temp_min + 1.0
+    return np.linspace(temp_min, temp_max, bins + 1)
+
+
+def bin_index(values, edges):
+    """Bin of each value with ``np.histogram`` semantics; -1 for NaN or out of range."""
+    values = np.asarray(values, dtype=np.float64)
+    bins = np.searchsorted(edges, values, side="right") - 1
+    bins[values == edges[-1]] = len(edges) - 2  # the last bin is closed
+    bins[(bins < 0) | (bins >= len(edges) - 1) | np.isnan(values)] = -1
+    return bins
+
+
+def bin_counts(values, edges, weights=None):
+    """Histogram of ``values`` (optionally weighted) on ``edges``.
+
+    Large inputs are binned in row partitions and the counts added up.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = None if weights is None else np.asarray(weights)
+
+    def partial(rows):
+        bins = bin_index(values[rows], edges)
+        keep = bins >= 0
+        part = None if weights is None else weights[rows][keep]
+        return np.bincount(bins[keep], weights=part, minlength=len(edges) - 1)
+
+    return np.sum(map_rows(partial, len(values)), axis=0).astype(np.int64)
+
+
+class TemperatureHistogram:
+    """Per-state bin counts over the State and Temperature(F) columns."""
+
+    def __init__(self, state, temperature, index, bins=HIST_BINS):
+        self.index = index
+        self.edges = histogram_edges(index.temp_min, index.temp_max, bins)
+        codes = np.asarray(pd.Categorical(state, categories=index.categories).codes, dtype=np.int64)
+        self._temps = np.asarray(temperature, dtype=np.float64)
+        row_bins = bin_index(self._temps, self.edges)
+        keep = (codes >= 0) & (row_bins >= 0)
+        flat = np.bincount(codes[keep] * bins + row_bins[keep], minlength=len(index.categories) * bins)
+        self._counts = flat.reshape(len(index.categories), bins)
+
+    @classmethod
+    def from_frame(cls, df, index):
+        return cls(df["State"], df["Temperature(F)"], index)
+
+    def query(self, states, temp_range=None):
+        """Bin counts of the rows matching ``FilterIndex.select(states, temp_range)``."""
+        codes = sorted({self.index._codes[s] for s in states if s in self.index._codes})
+        counts = self._counts[codes].sum(axis=0).astype(np.int64)
+        if temp_range is None:
+            return counts
+
+        lo, hi = stored_temp_range(temp_range)
+        left, right = self.edges[:-1], self.edges[1:]
+        inside = (left >= lo) & (right <= hi)
+        cut = ~inside & (right >= lo) & (left <= hi)
+        counts[~inside] = 0
+        for i in np.flatnonzero(cut):
+            rows = self.index.select(states, (max(lo, left[i]), min(hi, right[i])))
+            counts[i] = bin_counts(self._temps[rows], self.edges)[i]
+        return counts
+
+
+@st.cache_resource(max_entries=2)
+def _build_histogram(csv_path, version):
+    df = load_accidents(["State", "Temperature(F)"], csv_path)
+    return TemperatureHistogram.from_frame(df, load_filter_index(csv_path))
+
+
+def load_histogram(csv_path=CSV_PATH):
+    """Return the shared ``TemperatureHistogram`` for the current dataset version."""
+    return _build_histogram(str(csv_path), data_version(load_manifest(csv_path)))
@@ -0,0 +1,408 @@
+# utils/ingest.py
+"""Chunked ingest for CSVs larger than memory.
+
+``stream_ingest`` reads the CSV in fixed-size chunks, converts each chunk to
+the compact schema, folds it into running aggregates and appends it to a
+Parquet dataset partitioned by ``State`` and ``year``. Only one chunk is in
+memory at a time. ``utils.data.ensure_columnar`` switches to this path for
+large files; it can also be run directly::
+
+    python -m utils.ingest data/US_Accidents_March23.csv --chunk-rows 500000
+
+``append_ingest`` adds a new drop of records to an existing dataset: the new
+rows become extra files in their ``State=/year=`` partitions and the stored
+aggregates are updated by delta, so nothing already ingested is re-read.
+Both are staged under the revision being written (``append-<revision>-*``
+files, which readers skip until the manifest names that revision, and a new
+aggregates directory), so replacing the manifest is the only step that
+publishes a drop. The manifest's ``revision`` and per-partition revisions
+tell the pages which cached answers the drop invalidated::
+
+    python -m utils.ingest data/accidents_small.csv --append data/drops/2023-03-01.csv
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.cube import _NAT, _NS_PER_DAY
+from utils.data import (
+    CSV_PATH, MANIFEST_VERSION, ROW_GROUP_ROWS, coerce_types, columnar_paths, csv_fingerprint, ensure_columnar,
+)
+
+CHUNK_ROWS = 250_000
+TEMP_BIN_WIDTH = 1.0  # °F, same buckets as utils.cube
+GEO_CELL_SIZE = 0.1  # degrees
+PARTITION_COLS = ["State", "year"]
+AGGREGATES_DIR = "_aggregates"  # leading underscore: skipped by dataset discovery
+CELL_KEYS = ["State", "day", "has_temp"]
+CELL_DTYPES = {"count": "float64", "temp_sum": "float64", "temp_count": "float64", "max_time": "int64"}
+
+
+class RunningAggregates:
+    """State/day/temperature/geo counts updated one chunk at a time.
+
+    ``daily_cells`` holds, per (State, day, has a temperature), the same
+    count / temperature sum / latest ``Start_Time`` cells that
+    ``utils.cube.summarize`` reduces, so query backends can answer a
+    selection with no temperature cut from them without scanning rows.
+    """
+
+    def __init__(self):
+        self.state_counts = pd.Series(dtype="float64")
+        self.daily_counts = pd.Series(dtype="float64")
+        self.temp_hist = pd.Series(dtype="float64")  # (State, bin) -> count
+        self.geo_bins = pd.DataFrame(columns=["count", "temp_sum"], dtype="float64")
+        self.daily_cells = pd.DataFrame(columns=list(CELL_DTYPES)).astype(CELL_DTYPES)
+        self.temp_min = self.temp_max = None
+        self.time_min = self.time_max = None
+
+    @classmethod
+    def read(cls, out_dir, domain):
+        """Aggregates previously written to ``out_dir`` (with the manifest ``domain``), ready for more updates."""
+        out_dir = Path(out_dir)
+        aggregates = cls()
+        frames = {
+            name: pd.read_parquet(out_dir / f"{name}.parquet")
+            for name in ("state_counts", "daily_counts", "temp_hist", "geo_bins", "daily_cells")
+        }
+        aggregates.state_counts = frames["state_counts"].set_index("State")["count"].astype("float64")
+        aggregates.daily_counts = frames["daily_counts"].set_index("Start_Day")["count"].astype("float64")
+        aggregates.temp_hist = frames["temp_hist"].set_index(["State", "bin"])["count"].astype("float64")
+        aggregates.geo_bins = frames["geo_bins"].set_index(["gx", "gy"]).astype("float64")
+        aggregates.daily_cells = frames["daily_cells"].set_index(CELL_KEYS).astype(CELL_DTYPES)
+        aggregates.temp_min, aggregates.temp_max = domain["temp_min"], domain["temp_max"]
+        if domain["time_min"] is not None:
+            aggregates.time_min = pd.Timestamp(domain["time_min"])
+            aggregates.time_max = pd.Timestamp(domain["time_max"])
+        return aggregates
+
+    @staticmethod
+    def _add(total, part):
+        # Counts accumulate as float64 (exact to 2**53) and are cast on write.
+        return part.astype("float64") if total.empty else total.add(part, fill_value=0)
+
+    @staticmethod
+    def _add_cells(total, part):
+        # Latest times stay int64 nanoseconds, which float64 cannot hold exactly.
+        part = part.astype(CELL_DTYPES)
+        if total.empty:
+            return part
+        merged = pd.concat([total, part]).groupby(level=CELL_KEYS)
+        return merged[["count", "temp_sum", "temp_count"]].sum().join(merged["max_time"].max())
+
+    def update(self, chunk):
+        state = chunk["State"].astype("string")
+        self.state_counts = self._add(self.state_counts, state.value_counts())
+
+        if "Start_Day" in chunk.columns:
+            days = chunk["Start_Day"].dropna()
+            self.daily_counts = self._add(self.daily_counts, days.value_counts())
+
+        temps = chunk["Temperature(F)"]
+        self.temp_min = _fold(min, self.temp_min, temps.min())
+        self.temp_max = _fold(max, self.temp_max, temps.max())
+        self.time_min = _fold(min, self.time_min, chunk["Start_Time"].min())
+        self.time_max = _fold(max, self.time_max, chunk["Start_Time"].max())
+        has_temp = temps.notna() & state.notna()
+        bins = np.floor(temps[has_temp] / TEMP_BIN_WIDTH).astype("int64")
+        hist = pd.Series(1, index=[state[has_temp], bins]).groupby(level=[0, 1]).sum().rename_axis(["State", "bin"])
+        self.temp_hist = self._add(self.temp_hist, hist)
+
+        located = chunk["Start_Lat"].notna() & chunk["Start_Lng"].notna() & has_temp
+        gx = np.floor((chunk.loc[located, "Start_Lng"].astype("float64") + 180.0) / GEO_CELL_SIZE).astype("int64")
+        gy = np.floor((chunk.loc[located, "Start_Lat"].astype("float64") + 90.0) / GEO_CELL_SIZE).astype("int64")
+        cells = pd.DataFrame({"gx": gx, "gy": gy, "count": 1.0, "temp_sum": temps[located].astype("float64")})
+        self.geo_bins = self._add(self.geo_bins, cells.groupby(["gx", "gy"])[["count", "temp_sum"]].sum())
+
+        # Same cell encoding as utils.cube: days and times as int64 with _NAT for missing.
+        times = chunk["Start_Time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        stated = state.notna().to_numpy()
+        rows = pd.DataFrame({
+            "State": state[stated].to_numpy(dtype=object),
+            "day": np.where(times == _NAT, _NAT, times // _NS_PER_DAY)[stated],
+            "has_temp": temps.notna().to_numpy()[stated],
+            "temp": temps.astype("float64").to_numpy()[stated],
+            "time": times[stated],
+        })
+        grouped = rows.groupby(CELL_KEYS, sort=False)
+        self.daily_cells = self._add_cells(self.daily_cells, grouped.agg(
+            count=("temp", "size"), temp_sum=("temp", "sum"), temp_count=("temp", "count"), max_time=("time", "max"),
+        ))
+
+    def domain(self):
+        """Filter bounds for the pages, in the same shape as ``utils.data.frame_domain``."""
+        return {
+            "states": sorted(self.state_counts.index),
+            "temp_min": self.temp_min,
+            "temp_max": self.temp_max,
+            "time_min": None if self.time_min is None else self.time_min.isoformat(),
+            "time_max": None if self.time_max is None else self.time_max.isoformat(),
+        }
+
+    def _frames(self):
+        return {
+            "state_counts": self.state_counts.rename_axis("State").rename("count").reset_index(),
+            "daily_counts": self.daily_counts.rename_axis("Start_Day").rename("count").reset_index(),
+            "temp_hist": self.temp_hist.rename_axis(["State", "bin"]).rename("count").reset_index(),
+            "geo_bins": self.geo_bins.rename_axis(["gx", "gy"]).reset_index(),
+            "daily_cells": self.daily_cells.rename_axis(CELL_KEYS).reset_index(),
+        }
+
+    def write(self, out_dir):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name, frame in self._frames().items():
+            for col in ("count", "temp_count", "max_time"):
+                if col in frame:
+                    frame[col] = frame[col].astype("int64")
+            tmp = out_dir / f"{name}.parquet.tmp"
+            frame.to_parquet(tmp, index=False)
+            os.replace(tmp, out_dir / f"{name}.parquet")
+
+
+def _fold(pick, current, value):
+    if pd.isna(value):
+        return current
+    value = float(value) if isinstance(value, (np.floating, float)) else value
+    return value if current is None else pick(current, value)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _ingest_chunks(csv_path, dataset_dir, aggregates, chunk_rows, prefix):
+    """Write ``csv_path`` into the partitions of ``dataset_dir`` chunk by chunk; return ingest stats."""
+    stats = {"rows": 0, "chunks": 0, "raw_bytes": {}, "timestamps": {}, "dtypes": {}, "partitions": set()}
+    for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_rows)):
+        for col, n in chunk.memory_usage(deep=True, index=False).items():
+            stats["raw_bytes"][col] = stats["raw_bytes"].get(col, 0) + int(n)
+        report = {}
+        chunk = coerce_types(chunk, report)
+        _merge_timestamps(stats["timestamps"], report)
+
+        aggregates.update(chunk)
+        stats["dtypes"].update({col: str(dtype) for col, dtype in chunk.dtypes.items()})
+        chunk = chunk.sort_values(["State", "Start_Time"], na_position="last", kind="stable", ignore_index=True)
+        chunk["year"] = chunk["Start_Time"].dt.year.astype("Int16")
+        stats["partitions"].update(
+            _partition_key(state, year) for state, year in chunk[PARTITION_COLS].drop_duplicates().itertuples(index=False)
+        )
+        pq.write_to_dataset(
+            pa.Table.from_pandas(chunk, preserve_index=False),
+            dataset_dir,
+            partition_cols=PARTITION_COLS,
+            basename_template=f"{prefix}-{i:05d}-{{i}}.parquet",
+            max_rows_per_group=ROW_GROUP_ROWS,
+            min_rows_per_group=0,
+        )
+        stats["rows"] += len(chunk)
+        stats["chunks"] += 1
+    return stats
+
+
+def _merge_timestamps(total, report):
+    for col, stats in report.items():
+        merged = total.setdefault(col, {"formats": {}, "failures": 0})
+        merged["failures"] += stats["failures"]
+        for fmt, n in stats["formats"].items():
+            merged["formats"][fmt] = merged["formats"].get(fmt, 0) + n
+
+
+def _partition_key(state, year):
+    # Same spelling as the manifest's ``partitions`` map: "CA/2021"; missing values as "null".
+    return f"{'null' if pd.isna(state) else state}/{'null' if pd.isna(year) else int(year)}"
+
+
+def _ingest_report(stats, chunk_rows, seconds):
+    return {
+        "chunks": stats["chunks"],
+        "chunk_rows": chunk_rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(stats["rows"] / seconds) if seconds else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _aggregates_dir(revision):
+    # Relative to the dataset directory, as recorded in the manifest.
+    return f"{AGGREGATES_DIR}/r{revision:05d}"
+
+
+def _discard_revision(dataset_dir, revision):
+    # Files staged for ``revision`` by an append that failed or was killed.
+    for path in dataset_dir.glob(f"*/*/append-{revision:05d}-*.parquet"):
+        path.unlink()
+    shutil.rmtree(dataset_dir / _aggregates_dir(revision), ignore_errors=True)
+
+
+def _prune_aggregates(dataset_dir, revision):
+    # Readers of the previous manifest may still open its aggregates; older ones go.
+    for path in (dataset_dir / AGGREGATES_DIR).glob("r*"):
+        if path.is_dir() and int(path.name[1:]) < revision - 1:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_manifest(manifest_path, manifest):
+    # Written last and replaced atomically: it is what publishes a new revision.
+    tmp = manifest_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, manifest_path)
+
+
+def stream_ingest(csv_path=CSV_PATH, chunk_rows=CHUNK_ROWS):
+    """Ingest ``csv_path`` chunk by chunk into a partitioned Parquet dataset.
+
+    Writes the dataset, its aggregates and the manifest used by
+    ``utils.data``; returns the dataset directory.
+    """
+    csv_path = Path(csv_path)
+    manifest_path = columnar_paths(csv_path)[1]
+    dataset_dir = manifest_path.with_suffix("")
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    dataset_dir.mkdir(parents=True)
+
+    aggregates = RunningAggregates()
+    started = time.perf_counter()
+    stats = _ingest_chunks(csv_path, dataset_dir, aggregates, chunk_rows, "part")
+    aggregates.write(dataset_dir / _aggregates_dir(0))
+    domain = aggregates.domain()
+    _write_manifest(manifest_path, {
+        "version": MANIFEST_VERSION,
+        "source": str(csv_path),
+        "fingerprint": csv_fingerprint(csv_path),
+        "parquet": str(dataset_dir),
+        "layout": "partitioned",
+        "aggregates": _aggregates_dir(0),
+        "rows": stats["rows"],
+        "columns": [col for col in stats["dtypes"] if col not in PARTITION_COLS[1:]],
+        "dtypes": stats["dtypes"],
+        "raw_bytes": stats["raw_bytes"],
+        "timestamps": stats["timestamps"],
+        "domain": domain,
+        "refreshed": datetime.now().isoformat(timespec="seconds"),
+        "watermark": domain["time_max"],
+        "revision": 0,
+        "domain_revision": 0,
+        "partitions": {},
+        "appends": [],
+        "ingest": _ingest_report(stats, chunk_rows, time.perf_counter() - started),
+    })
+    return dataset_dir
+
+
+def append_ingest(new_csv, csv_path=CSV_PATH, chunk_rows=CHUNK_ROWS):
+    """Append the records of ``new_csv`` to the dataset of ``csv_path``.
+
+    The new rows are written as extra files in their partitions and the
+    stored aggregates are updated by delta; nothing already ingested is
+    re-read. Nothing is visible before the new manifest replaces the old
+    one, and a failed append leaves the dataset as it was. A single-file
+    dataset is converted to the partitioned layout once. Appending the same
+    file (same size and mtime) twice is a no-op. Returns the new manifest.
+    """
+    new_csv, csv_path = Path(new_csv), Path(csv_path)
+    manifest_path = columnar_paths(csv_path)[1]
+    ensure_columnar(csv_path)
+    manifest = json.loads(manifest_path.read_text())
+    if manifest.get("layout") != "partitioned":
+        stream_ingest(csv_path, chunk_rows)
+        manifest = json.loads(manifest_path.read_text())
+
+    fingerprint = csv_fingerprint(new_csv)
+    if any(a["source"] == str(new_csv) and a["fingerprint"] == fingerprint for a in manifest["appends"]):
+        return manifest
+
+    dataset_dir = Path(manifest["parquet"])
+    revision = manifest["revision"] + 1
+    _discard_revision(dataset_dir, revision)  # leftovers of an append that was killed
+    aggregates = RunningAggregates.read(
+        dataset_dir / manifest.get("aggregates", AGGREGATES_DIR), manifest["domain"]
+    )
+    started = time.perf_counter()
+    try:
+        stats = _ingest_chunks(new_csv, dataset_dir, aggregates, chunk_rows, f"append-{revision:05d}")
+        aggregates.write(dataset_dir / _aggregates_dir(revision))
+    except BaseException:
+        # Nothing is published until the manifest is replaced: drop what was staged.
+        _discard_revision(dataset_dir, revision)
+        raise
+
+    domain = aggregates.domain()
+    bounds_changed = (domain["temp_min"], domain["temp_max"]) != (
+        manifest["domain"]["temp_min"], manifest["domain"]["temp_max"]
+    )
+    for col, n in stats["raw_bytes"].items():
+        manifest["raw_bytes"][col] = manifest["raw_bytes"].get(col, 0) + n
+    _merge_timestamps(manifest["timestamps"], stats["timestamps"])
+    manifest.update({
+        "rows": manifest["rows"] + stats["rows"],
+        "domain": domain,
+        "refreshed": datetime.now().isoformat(timespec="seconds"),
+        "watermark": domain["time_max"],
+        "revision": revision,
+        "domain_revision": manifest["domain_revision"] + bounds_changed,
+        "aggregates": _aggregates_dir(revision),
+    })
+    manifest["partitions"].update({key: revision for key in stats["partitions"]})
+    manifest["appends"].append({
+        "source": str(new_csv),
+        "fingerprint": fingerprint,
+        "revision": revision,
+        "rows": stats["rows"],
+        "partitions": sorted(stats["partitions"]),
+        "ingest": _ingest_report(stats, chunk_rows, time.perf_counter() - started),
+    })
+    try:
+        _write_manifest(manifest_path, manifest)
+    except BaseException:
+        _discard_revision(dataset_dir, revision)
+        raise
+    _prune_aggregates(dataset_dir, revision)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chunked ingest of a US Accidents CSV.")
+    parser.add_argument("csv", nargs="?", default=str(CSV_PATH))
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--append", nargs="+", metavar="CSV", help="new record files to add to the dataset of csv")
+    args = parser.parse_args(argv)
+
+    if args.append:
+        manifest_path = columnar_paths(Path(args.csv))[1]
+        for new_csv in args.append:
+            before = json.loads(manifest_path.read_text()).get("revision") if manifest_path.exists() else None
+            manifest = append_ingest(new_csv, args.csv, args.chunk_rows)
+            if manifest["revision"] == before:
+                print(f"{new_csv}: already appended, nothing to do (revision {manifest['revision']})")
+                continue
+            last = manifest["appends"][-1]
+            print(
+                f"{new_csv}: revision {manifest['revision']}, {last['rows']:,} rows into "
+                f"{len(last['partitions'])} partitions in {last['ingest']['seconds']:.1f}s "
+                f"(data through {manifest['watermark']})"
+            )
+        return
+
+    dataset_dir = stream_ingest(args.csv, args.chunk_rows)
+    stats = json.loads(columnar_paths(Path(args.csv))[1].read_text())["ingest"]
+    print(
+        f"{dataset_dir}: {stats['chunks']} chunks in {stats['seconds']:.1f}s "
+        f"({stats['rows_per_second']:,} rows/s, peak RSS {stats['peak_rss_mb']:.0f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+# utils/loadtest.py
+"""Concurrent-session load test of the app's pages.
+
+The tool starts one ``streamlit run app.py`` server and connects N simulated
+users to it over the websocket the browser uses (``/_stcore/stream``), so
+the sessions share what real sessions share: the server's script threads,
+GIL, ``st.cache_resource`` engines and chart LRU. A user sends the same
+``rerun_script`` messages a browser sends, reads the page back with
+``AppTest``'s element-tree parser to find the widgets, and times each rerun
+from the request to the server's ``script_finished``. Each user opens a page
+(weighted by ``PAGE_WEIGHTS``) and replays its interaction script with think
+time in between: pick states, drag the temperature slider through a few
+positions, narrow the Dashboard's date range.
+
+After one untimed visit to every page, each session count runs for
+``--duration`` seconds and reports p50/p95/p99 rerun latency, reruns per
+second, and the server's CPU and peak RSS (read from ``/proc``, so Linux
+only). Failures of the harness (connection errors, timeouts) are counted
+apart from exceptions the app's scripts raise. By default it runs offline on
+a synthetic dataset (``utils.bench.synthesize``)::
+
+    python -m utils.loadtest --sessions 1 2 4 8 16 --duration 30 --rows 100000
+
+The users run on one event loop in this process, next to the server: on a
+small machine they take some of its CPU. Every widget change reruns the
+whole script (a browser reruns only the fragment holding the widget), and
+nothing is rendered, so latencies are those of full reruns without the
+browser's rendering time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from utils.bench import BENCH_DIR
+
+DEFAULT_SESSIONS = [1, 2, 4, 8]
+# Script -> weight; pages are requested by their URL path (``page_name``).
+PAGE_WEIGHTS = {"app.py": 1, "pages/2_Charts_Gallery.py": 3, "pages/3_Dashboard.py": 3}
+PAGE_NAMES = {"app.py": "", "pages/2_Charts_Gallery.py": "Charts_Gallery", "pages/3_Dashboard.py": "Dashboard"}
+DRAG_STEPS = 4  # reruns per slider drag
+RERUN_TIMEOUT = 300
+SERVER_START_TIMEOUT = 60
+SAMPLE_SECONDS = 0.5  # server CPU/RSS sampling period
+
+
+# -----------------------------------------------------------
+# Interaction scripts
+# -----------------------------------------------------------
+# Each action yields the widget states of one change, as the browser would
+# send them; the session times the rerun each one triggers.
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def _state(widget, field, values):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    state = WidgetState(id=widget.id)
+    getattr(state, field).data[:] = values
+    return state
+
+
+def _pick_states(tree, rng, states):
+    widget = _widget(tree.multiselect, "Select States")
+    count = min(int(rng.integers(1, 8)), len(widget.options))
+    picked = [str(s) for s in rng.choice(widget.options, size=count, replace=False)]
+    yield _state(widget, "string_array_value", picked)
+
+
+def _drag_temperature(tree, rng, states):
+    widget = _widget(tree.slider, "Temperature Range (°F)")
+    low, high = widget.proto.min, widget.proto.max
+    current = states.get(widget.id)
+    start = np.asarray(current.double_array_value.data if current else widget.proto.default, dtype=float)
+    target = np.sort(rng.uniform(low, high, 2))
+    for step in range(1, DRAG_STEPS + 1):
+        lo, hi = np.round(start + (target - start) * step / DRAG_STEPS, 1)
+        yield _state(widget, "double_array_value", [float(max(lo, low)), float(min(hi, high))])
+
+
+def _narrow_dates(tree, rng, states):
+    widget = _widget(tree.date_input, "Select Date Range")
+    first, last = widget.min, widget.max
+    span = (last - first).days
+    if span < 2:
+        return
+    # A year first, then a month or so inside it.
+    year_start = first + timedelta(days=int(rng.integers(0, max(1, span - 365))))
+    year_end = min(last, year_start + timedelta(days=365))
+    yield _state(widget, "string_array_value", [year_start.isoformat(), year_end.isoformat()])
+    month_start = year_start + timedelta(days=int(rng.integers(0, max(1, (year_end - year_start).days - 30))))
+    month_end = min(year_end, month_start + timedelta(days=30))
+    yield _state(widget, "string_array_value", [month_start.isoformat(), month_end.isoformat()])
+
+
+SCRIPTS = {
+    "app.py": [],
+    "pages/2_Charts_Gallery.py": [_pick_states, _drag_temperature, _pick_states],
+    "pages/3_Dashboard.py": [_pick_states, _drag_temperature, _narrow_dates],
+}
+
+
+# -----------------------------------------------------------
+# Simulated users
+# -----------------------------------------------------------
+class HarnessError(Exception):
+    """The load test itself failed (connection, timeout, protocol), not the app."""
+
+
+class Client:
+    """One browser session: a websocket to the server and the widget states it has sent."""
+
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        self.states = {}  # widget id -> WidgetState, resent on every rerun like the browser does
+
+    async def connect(self):
+        import websockets  # a Streamlit dependency
+
+        self.connection = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+
+    async def rerun(self, script, changed=None):
+        """Rerun ``script`` with ``changed`` widget states; return the element tree it drew."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.testing.v1.element_tree import parse_tree_from_messages
+
+        if changed is None:
+            self.states = {}  # opening a page starts from its defaults
+        else:
+            self.states[changed.id] = changed
+        request = BackMsg()
+        request.rerun_script.page_name = PAGE_NAMES[script]
+        request.rerun_script.widget_states.widgets.extend(self.states.values())
+        await self.connection.send(request.SerializeToString())
+
+        messages = []
+        while True:
+            message = ForwardMsg()
+            message.ParseFromString(await self.connection.recv())
+            if message.HasField("ref_hash"):
+                raise HarnessError("server sent a cached-message reference")
+            if message.HasField("script_finished"):
+                if message.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                return parse_tree_from_messages(messages)
+            messages.append(message)
+
+
+class SessionLog:
+    """Rerun latencies and errors of all users of a level."""
+
+    def __init__(self):
+        self.reruns = []  # (script, seconds) of the reruns that completed
+        self.app_errors = []  # exceptions raised by the page scripts
+        self.harness_errors = []  # connection errors, timeouts
+
+    async def timed(self, script, rerun):
+        started = time.perf_counter()
+        try:
+            tree = await asyncio.wait_for(rerun, RERUN_TIMEOUT)
+        except Exception as e:
+            self.harness_errors.append(f"{script}: {type(e).__name__}: {e}")
+            return None
+        self.reruns.append((script, time.perf_counter() - started))
+        self.app_errors += [f"{script}: {e.value}" for e in tree.exception]
+        return tree
+
+
+async def _session(url, index, seed, think, deadline, log):
+    rng = np.random.default_rng([seed, index])
+    scripts = list(PAGE_WEIGHTS)
+    weights = np.asarray([PAGE_WEIGHTS[s] for s in scripts], dtype=float)
+    client = Client(url)
+    try:
+        await client.connect()
+    except Exception as e:
+        log.harness_errors.append(f"connect: {type(e).__name__}: {e}")
+        return
+    try:
+        await asyncio.sleep(rng.uniform(0, think))  # users do not all arrive at once
+        while time.perf_counter() < deadline:
+            script = scripts[rng.choice(len(scripts), p=weights / weights.sum())]
+            tree = await log.timed(script, client.rerun(script))
+            for action in SCRIPTS[script]:
+                if tree is None or time.perf_counter() >= deadline:
+                    break
+                await asyncio.sleep(rng.exponential(think))
+                for changed in action(tree, rng, client.states):
+                    tree = await log.timed(script, client.rerun(script, changed))
+                    if tree is None:
+                        break
+            if tree is None:
+                # The connection may be unusable after a failure; start a fresh session.
+                await client.close()
+                client = Client(url)
+                await client.connect()
+    finally:
+        await client.close()
+
+
+# -----------------------------------------------------------
+# Server
+# -----------------------------------------------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(csv_path, port):
+    """Start ``streamlit run app.py`` on ``port``; return the process once it answers health checks."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "app.py", "--server.headless", "true",
+         "--server.port", str(port), "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONPATH": ".", "ACCIDENTS_CSV": str(csv_path)},
+    )
+    deadline = time.perf_counter() + SERVER_START_TIMEOUT
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit exited with {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"streamlit did not answer on port {port} within {SERVER_START_TIMEOUT}s")
+
+
+def server_usage(pid):
+    """``(cpu_seconds, rss_mb)`` of process ``pid`` from ``/proc``."""
+    with open(f"/proc/{pid}/stat") as f:
+        # Fields after the parenthesized command name; utime and stime are the 14th and 15th.
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    return cpu, rss
+
+
+async def _sample_rss(pid, peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], server_usage(pid)[1])
+        try:
+            await asyncio.wait_for(stop.wait(), SAMPLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _percentiles(seconds):
+    if not seconds:
+        return {}
+    values = np.percentile(seconds, [50, 95, 99])
+    return {"p50": values[0], "p95": values[1], "p99": values[2], "max": max(seconds)}
+
+
+async def warm_up(url):
+    """Visit every page once, untimed: the first visit builds the shared engines and caches."""
+    client = Client(url)
+    await client.connect()
+    try:
+        for script in PAGE_WEIGHTS:
+            await asyncio.wait_for(client.rerun(script), RERUN_TIMEOUT)
+    finally:
+        await client.close()
+
+
+async def run_level(url, pid, sessions, duration, think=1.0, seed=0):
+    """Run ``sessions`` concurrent users against the server for ``duration`` seconds; return the result dict."""
+    log = SessionLog()
+    cpu_before, rss_before = server_usage(pid)
+    peak, stop = [rss_before], asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_rss(pid, peak, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _session(url, i, seed, think, started + duration, log) for i in range(sessions)
+    ))
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+    cpu = server_usage(pid)[0] - cpu_before
+
+    seconds = [s for _, s in log.reruns]
+    return {
+        "sessions": sessions,
+        "seconds": wall,
+        "reruns": len(seconds),
+        "reruns_per_second": len(seconds) / wall,
+        "latency": _percentiles(seconds),
+        "latency_by_script": {
+            script: _percentiles([s for name, s in log.reruns if name == script]) for script in PAGE_WEIGHTS
+        },
+        "server_cpu_seconds": cpu,
+        "server_cpu_percent": 100 * cpu / wall,  # of one core
+        "server_rss_mb": peak[0],
+        "rss_per_session_mb": max(0.0, peak[0] - rss_before) / sessions,
+        "app_errors": len(log.app_errors),
+        "app_error_samples": sorted(set(log.app_errors))[:5],
+        "harness_errors": len(log.harness_errors),
+        "harness_error_samples": sorted(set(log.harness_errors))[:5],
+    }
+
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+def _round(value):
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, dict):
+        return {k: _round(v) for k, v in value.items()}
+    return value
+
+
+async def _run_levels(url, pid, args, results):
+    await warm_up(url)
+    print(f"{'sessions':>8} {'reruns':>7} {'rerun/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'cpu%':>6} "
+          f"{'rss MB':>8} {'MB/sess':>8} {'app err':>7} {'harness':>7}")
+    for sessions in args.sessions:
+        level = _round(await run_level(url, pid, sessions, args.duration, args.think, args.seed))
+        results["levels"].append(level)
+        latency = level["latency"]
+        print(
+            f"{sessions:>8} {level['reruns']:>7} {level['reruns_per_second']:>8.2f} {latency.get('p50', 0):>7.3f} "
+            f"{latency.get('p95', 0):>7.3f} {latency.get('p99', 0):>7.3f} {level['server_cpu_percent']:>6.0f} "
+            f"{level['server_rss_mb']:>8,.0f} {level['rss_per_session_mb']:>8.1f} {level['app_errors']:>7} "
+            f"{level['harness_errors']:>7}"
+        )
+        for sample in level["app_error_samples"] + level["harness_error_samples"]:
+            print(f"{'':>8}   {sample}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the pages with concurrent sessions on one server.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per session count")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between actions, seconds")
+    parser.add_argument("--rows", type=int, default=100_000, help="synthetic dataset size")
+    parser.add_argument("--csv", help="use this CSV instead of synthetic data")
+    parser.add_argument("--p95-budget", type=float, default=1.0, help="p95 rerun latency a session count must meet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=str(BENCH_DIR / "loadtest.json"))
+    args = parser.parse_args(argv)
+
+    from utils.bench import synthesize
+    from utils.data import ensure_columnar
+
+    csv_path = Path(args.csv) if args.csv else BENCH_DIR / f"accidents_{args.rows}.csv"
+    if not csv_path.exists():
+        synthesize(args.rows, csv_path, args.seed)
+    ensure_columnar(csv_path)  # ingest once, outside the timed runs
+
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "csv": str(csv_path),
+        "duration": args.duration,
+        "think": args.think,
+        "levels": [],
+    }
+    port = _free_port()
+    server = start_server(csv_path, port)
+    try:
+        asyncio.run(_run_levels(f"ws://127.0.0.1:{port}/_stcore/stream", server.pid, args, results))
+    finally:
+        server.terminate()
+        server.wait()
+
+    # The largest session count whose p95 stays within the budget. Harness
+    # failures are reported but say nothing about the app; a level with app
+    # errors or without a single completed rerun does not count.
+    within = [
+        level["sessions"] for level in results["levels"]
+        if level["reruns"] and not level["app_errors"] and level["latency"].get("p95", 0) <= args.p95_budget
+    ]
+    results["capacity"] = {"p95_budget": args.p95_budget, "sessions": max(within) if within else 0}
+    print(f"capacity: {results['capacity']['sessions']} sessions at p95 <= {args.p95_budget:g}s")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"wrote {out}")
+    return 0 if all(not level["app_errors"] and not level["harness_errors"] for level in results["levels"]) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+# utils/memo.py
+"""Memoized chart results keyed on the normalized filter selection.
+
+One process-wide, memory-bounded LRU cache holds the aggregated frames and
+Plotly figures the pages build for a filter combination, so flipping back to
+a recent selection skips both the aggregation and the figure build.
+"""
+import dataclasses
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+
+from utils.metrics import count_lookup
+
+CHART_CACHE_BYTES = 64 * 1024**2
+
+
+def filter_key(states, temp_range=None, date_range=None):
+    """Normalize a sidebar selection into a hashable cache key."""
+    temps = None if temp_range is None else tuple(round(float(t), 4) for t in temp_range)
+    dates = None
+    if date_range is not None:
+        dates = tuple(d.isoformat() if isinstance(d, date) else str(d) for d in date_range)
+    return tuple(sorted(str(s) for s in states)), temps, dates
+
+
+def selection_key(query, states, temp_range=None, date_range=None):
+    """Chart cache key of a selection: its data version and its normalized filters."""
+    return query.version(states, date_range), filter_key(states, temp_range, date_range)
+
+
+def nbytes(value):
+    """Approximate memory held by a cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(getattr(value, "nbytes", None), int):
+        # ndarrays and chart payloads know their own size
+        return value.nbytes
+    if hasattr(value, "to_plotly_json"):
+        # Serialized size is what Streamlit ships for this figure.
+        import plotly.io as pio
+
+        return len(pio.to_json(value, validate=False))
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    if dataclasses.is_dataclass(value):
+        return sum(nbytes(getattr(value, f.name)) for f in dataclasses.fields(value))
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total ``nbytes`` of its values.
+
+    With a ``name``, lookups are also counted on the current rerun's profile.
+    """
+
+    def __init__(self, max_bytes=CHART_CACHE_BYTES, name=None):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            found = key in self._entries
+            if found:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = self._entries[key][0]
+            else:
+                self.misses += 1
+                value = default
+        if self.name is not None:
+            count_lookup(self.name, miss=not found)
+        return value
+
+    def __contains__(self, key):
+        # A peek: neither counted as a lookup nor refreshing the entry
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@st.cache_resource
+def _chart_cache():
+    return LRUCache(name="chart_lru")
+
+
+def get_chart_cache():
+    """Return the process-wide chart cache shared by all pages and sessions."""
+    return _chart_cache()
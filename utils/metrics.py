@@ -0,0 +1,328 @@
+# utils/metrics.py
+"""Opt-in per-rerun instrumentation for the Gallery and the Dashboard.
+
+Turned on per session with ``?profile=1`` in the URL, or for every session
+with ``ACCIDENTS_PROFILE=1``. A page starts a ``RerunProfile`` at the top of
+its script and wraps each stage (load, filter/scan, aggregation, figure
+build, serialization, render) in ``profile.stage``; library code can open
+nested stages with the module-level ``stage``. When profiling is off both
+are no-ops.
+
+Each finished rerun is
+
+* shown in a collapsible sidebar panel (``show_profile``),
+* logged as one JSON line on the ``utils.metrics`` logger (to stderr unless
+  the deployment configured logging handlers itself), and
+* folded into a process-wide ``MetricsRegistry`` that is rewritten as an
+  OpenMetrics text file (``METRICS_PATH``) for a node_exporter textfile
+  collector or any other scraper to aggregate across sessions and servers.
+
+Cache lookups are counted on the rerun that makes them (``count_lookup``):
+``tracked_cache`` wraps the ``st.cache_resource`` data loaders, and the chart
+LRU reports its hits and misses, so a profile never includes the lookups of
+other sessions or of background threads.
+"""
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+import streamlit as st
+
+PROFILE_ENV = "ACCIDENTS_PROFILE"
+PROFILE_PARAM = "profile"
+# One file per server process so concurrent servers never overwrite each other;
+# files of processes that are gone are removed when a registry starts.
+METRICS_DIR = Path("data/.cache/metrics")
+METRICS_PATH = Path(os.environ.get("ACCIDENTS_METRICS_FILE", METRICS_DIR / f"accidents-{os.getpid()}.prom"))
+METRIC_PREFIX = "accidents"
+
+_LOGGER = logging.getLogger(__name__)
+_LOGGER_LOCK = threading.Lock()
+_TRUE = {"1", "true", "yes", "on"}
+_PID_FILE = re.compile(r"accidents-(\d+)\.prom")
+# The profile of the rerun running in this context (Streamlit runs a session's script in its own thread).
+_current = ContextVar("rerun_profile", default=None)
+
+
+# -----------------------------------------------------------
+# Cache hit/miss counters
+# -----------------------------------------------------------
+def count_lookup(name, miss=False):
+    """Count one lookup of the cache ``name`` on the current rerun's profile, if any."""
+    profile = _current.get()
+    if profile is not None and profile.enabled:
+        profile.count_lookup(name, miss)
+
+
+def tracked_cache(name, cache):
+    """Apply the caching decorator ``cache`` and count its lookups and misses under ``name``.
+
+    Use in place of the bare decorator::
+
+        @tracked_cache("load_column", st.cache_resource(max_entries=128))
+        def _load_column(...): ...
+    """
+    def decorate(func):
+        missed = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            # Only runs when the cache has no entry, in the thread that looked it up.
+            missed.flag = True
+            return func(*args, **kwargs)
+
+        cached = cache(compute)
+
+        @functools.wraps(func)
+        def lookup(*args, **kwargs):
+            missed.flag = False
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                count_lookup(name, missed.flag)
+
+        lookup.clear = cached.clear
+        return lookup
+
+    return decorate
+
+
+# -----------------------------------------------------------
+# Per-rerun profile
+# -----------------------------------------------------------
+def profiling_enabled():
+    """True when ``ACCIDENTS_PROFILE`` is set or the URL carries ``?profile=1``."""
+    if os.environ.get(PROFILE_ENV, "").lower() in _TRUE:
+        return True
+    try:
+        return st.query_params.get(PROFILE_PARAM, "").lower() in _TRUE
+    except Exception:  # no script run context (bare mode, benchmarks)
+        return False
+
+
+def _rerun_logger():
+    """``_LOGGER``, given a stderr handler the first time a profiled rerun logs.
+
+    Streamlit only configures its own loggers, so without a handler here the
+    INFO records would be dropped. A handler on this logger or on the root
+    logger (set up by the deployment) is used as is.
+    """
+    with _LOGGER_LOCK:
+        if not _LOGGER.handlers and not logging.getLogger().handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+            _LOGGER.addHandler(handler)
+            _LOGGER.setLevel(logging.INFO)
+    return _LOGGER
+
+
+class RerunProfile:
+    """Stage timings, row counts and payload bytes of one script rerun."""
+
+    def __init__(self, page, enabled=True):
+        self.page = page
+        self.enabled = enabled
+        self.stages = []
+        self.caches = {}  # cache -> {"hits", "misses"} of this rerun
+        self._open = []
+        if enabled:
+            self._started = time.perf_counter()
+
+    def count_lookup(self, name, miss=False):
+        counts = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+        counts["misses" if miss else "hits"] += 1
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the block as stage ``name``; the yielded dict takes ``rows``/``bytes``."""
+        record = {"stage": name}
+        if not self.enabled:
+            yield record
+            return
+        if self._open:
+            record["stage"] = f"{self._open[-1]}/{name}"
+        if rows is not None:
+            record["rows"] = rows
+        self._open.append(record["stage"])
+        self.stages.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            self._open.pop()
+
+    def finish(self, payload_bytes=None):
+        """Close the rerun: log it, add it to the registry and return its record."""
+        if not self.enabled:
+            return None
+        record = {
+            "page": self.page,
+            "seconds": time.perf_counter() - self._started,
+            "stages": self.stages,
+            "payload_bytes": dict(payload_bytes or {}),
+            "caches": self.caches,
+        }
+        _current.set(None)
+        _rerun_logger().info("rerun %s", json.dumps(record, default=str))
+        get_registry().observe(record)
+        return record
+
+
+def start_profile(page):
+    """Begin profiling this rerun of ``page`` (a no-op profile when profiling is off)."""
+    profile = RerunProfile(page, profiling_enabled())
+    _current.set(profile)
+    return profile
+
+
+def stage(name, rows=None):
+    """Nested stage in the current rerun's profile, if any."""
+    profile = _current.get()
+    if profile is None or not profile.enabled:
+        return _null_stage()
+    return profile.stage(name, rows)
+
+
+@contextmanager
+def _null_stage():
+    yield {}
+
+
+# -----------------------------------------------------------
+# Process-wide registry and OpenMetrics output
+# -----------------------------------------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Totals over every profiled rerun in this process."""
+
+    def __init__(self, path=METRICS_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.reruns = {}  # page -> [count, seconds]
+        self.stages = {}  # (page, stage) -> [count, seconds, rows]
+        self.payloads = {}  # (page, chart) -> [count, bytes]
+        self.caches = {}  # (page, cache) -> [hits, misses]
+
+    def observe(self, record):
+        page = record["page"]
+        with self._lock:
+            totals = self.reruns.setdefault(page, [0, 0.0])
+            totals[0] += 1
+            totals[1] += record["seconds"]
+            for item in record["stages"]:
+                totals = self.stages.setdefault((page, item["stage"]), [0, 0.0, 0])
+                totals[0] += 1
+                totals[1] += item.get("seconds", 0.0)
+                totals[2] += item.get("rows") or 0
+            for chart, n in record["payload_bytes"].items():
+                totals = self.payloads.setdefault((page, chart), [0, 0])
+                totals[0] += 1
+                totals[1] += n
+            for cache, counts in record["caches"].items():
+                totals = self.caches.setdefault((page, cache), [0, 0])
+                totals[0] += counts["hits"]
+                totals[1] += counts["misses"]
+            text = self._openmetrics()
+        self._write(text)
+
+    def openmetrics(self):
+        """The registry in OpenMetrics text exposition format."""
+        with self._lock:
+            return self._openmetrics()
+
+    def _openmetrics(self):
+        p = METRIC_PREFIX
+        lines = [f"# TYPE {p}_rerun_seconds summary", f"# UNIT {p}_rerun_seconds seconds"]
+        for page, (count, seconds) in sorted(self.reruns.items()):
+            lines.append(f"{p}_rerun_seconds_count{_labels(page=page)} {count}")
+            lines.append(f"{p}_rerun_seconds_sum{_labels(page=page)} {seconds:.6f}")
+        lines += [f"# TYPE {p}_stage_seconds summary", f"# UNIT {p}_stage_seconds seconds"]
+        for (page, name), (count, seconds, _) in sorted(self.stages.items()):
+            lines.append(f"{p}_stage_seconds_count{_labels(page=page, stage=name)} {count}")
+            lines.append(f"{p}_stage_seconds_sum{_labels(page=page, stage=name)} {seconds:.6f}")
+        lines.append(f"# TYPE {p}_stage_rows counter")
+        for (page, name), (_, _, rows) in sorted(self.stages.items()):
+            if rows:
+                lines.append(f"{p}_stage_rows_total{_labels(page=page, stage=name)} {rows}")
+        lines += [f"# TYPE {p}_chart_payload_bytes summary", f"# UNIT {p}_chart_payload_bytes bytes"]
+        for (page, chart), (count, n) in sorted(self.payloads.items()):
+            lines.append(f"{p}_chart_payload_bytes_count{_labels(page=page, chart=chart)} {count}")
+            lines.append(f"{p}_chart_payload_bytes_sum{_labels(page=page, chart=chart)} {n}")
+        lines.append(f"# TYPE {p}_cache_lookups counter")
+        for (page, cache), (hits, misses) in sorted(self.caches.items()):
+            lines.append(f"{p}_cache_lookups_total{_labels(page=page, cache=cache, result='hit')} {hits}")
+            lines.append(f"{p}_cache_lookups_total{_labels(page=page, cache=cache, result='miss')} {misses}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _write(self, text):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(text)
+            os.replace(tmp, self.path)  # scrapers never see a half-written file
+        except OSError:
+            _LOGGER.exception("could not write %s", self.path)
+
+
+def _prune_stale_files(directory=METRICS_DIR):
+    # Per-process files of servers that have exited would be scraped forever.
+    for path in directory.glob("accidents-*.prom"):
+        match = _PID_FILE.fullmatch(path.name)
+        if match is None or int(match.group(1)) == os.getpid():
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            path.unlink(missing_ok=True)
+        except OSError:  # alive, but owned by another user
+            pass
+
+
+@st.cache_resource
+def get_registry():
+    """Return the process-wide metrics registry."""
+    _prune_stale_files()
+    return MetricsRegistry()
+
+
+# -----------------------------------------------------------
+# Sidebar panel
+# -----------------------------------------------------------
+def show_profile(record):
+    """Collapsible sidebar panel with the stages and cache counts of ``record``."""
+    if record is None:
+        return
+    with st.sidebar.expander(f"⏱️ Profile — {record['seconds'] * 1000:,.0f} ms"):
+        st.dataframe(
+            [
+                {
+                    "stage": item["stage"],
+                    "ms": round(item.get("seconds", 0.0) * 1000, 1),
+                    "rows": item.get("rows"),
+                    "bytes": item.get("bytes"),
+                }
+                for item in record["stages"]
+            ],
+            hide_index=True,
+        )
+        for cache, counts in record["caches"].items():
+            st.caption(f"{cache}: {counts['hits']} hits, {counts['misses']} misses")
+        st.download_button(
+            "OpenMetrics", get_registry().openmetrics(), file_name="accidents.prom", mime="text/plain"
+        )
@@ -0,0 +1,43 @@
+# utils/parallel.py
+"""Row-partitioned aggregation on a shared thread pool.
+
+Large aggregations are split into contiguous row partitions, each partition
+is reduced on its own (bincounts, sorts, min/max), and the partial results
+are merged by the caller. Threads rather than processes: NumPy releases the
+GIL inside those kernels, and the partitions are slices of arrays that
+already live in this process, so nothing is pickled or copied.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import streamlit as st
+
+WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+MIN_PARTITION_ROWS = 250_000  # below this a thread hand-off costs more than it saves
+
+
+@st.cache_resource
+def _pool():
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="aggregate")
+
+
+def row_slices(n, min_rows=None, workers=None):
+    """Split ``range(n)`` into at most ``workers`` slices of at least ``min_rows``.
+
+    The defaults are read at call time, so tests and benchmarks can lower
+    ``MIN_PARTITION_ROWS`` or raise ``WORKERS`` to exercise the split path.
+    """
+    min_rows = MIN_PARTITION_ROWS if min_rows is None else min_rows
+    workers = WORKERS if workers is None else workers
+    parts = max(1, min(workers, n // max(min_rows, 1)))
+    bounds = np.linspace(0, n, parts + 1).astype(np.int64)
+    return [slice(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def map_rows(func, n, min_rows=None):
+    """Return ``[func(rows) for rows in row_slices(n)]``, computed in parallel when it pays off."""
+    slices = row_slices(n, min_rows)
+    if len(slices) == 1:
+        return [func(slices[0])]
+    return list(_pool().map(func, slices))
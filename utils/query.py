@@ -0,0 +1,469 @@
+# utils/query.py
+"""Filter + aggregate API shared by the Gallery and the Dashboard.
+
+Pages ask for aggregates of a sidebar selection (states, temperature range,
+optional date range) and never touch rows directly. ``load_query`` returns
+one of three backends:
+
+* ``InMemoryQuery`` for the single-file sample: answers come from the shared
+  in-memory engines (``FilterIndex``, ``AccidentCube``, ``GeoPyramid``).
+* ``PartitionedQuery`` for a chunk-ingested dataset: every answer starts
+  with an ``AccidentStore`` scan, so only the partitions and row groups that
+  can match the selection are read.
+* ``DuckDBQuery`` runs the aggregations as SQL over the Parquet files in an
+  embedded, multi-threaded engine that spills to ``data/.cache`` instead of
+  running out of memory. ``duckdb`` is optional.
+
+``QUERY_BACKEND`` (env ``ACCIDENTS_QUERY_BACKEND``) picks the backend:
+``"auto"`` uses DuckDB for partitioned datasets when it is installed and the
+pandas backends otherwise; ``"duckdb"`` and ``"pandas"`` force one.
+``check_parity`` compares two backends on a set of selections::
+
+    python -m utils.query --parity
+"""
+import argparse
+import importlib.util
+import math
+import os
+import threading
+from datetime import date
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.cube import _NAT, group_cells, load_cube, row_cells, summarize
+from utils.data import (
+    CACHE_DIR, CSV_PATH, column_array, data_version, dataset_files, load_accidents, load_manifest,
+    stored_temp_range,
+)
+from utils.filters import load_filter_index
+from utils.geo import bin_points, load_geo_pyramid
+from utils.hist import bin_counts, histogram_edges, load_histogram
+from utils.memo import filter_key, get_chart_cache
+from utils.metrics import stage, tracked_cache
+
+QUERY_BACKEND = os.environ.get("ACCIDENTS_QUERY_BACKEND", "auto")
+SPILL_DIR = CACHE_DIR / "duckdb_spill"
+# Optional; imported only when the DuckDB backend is actually opened.
+HAS_DUCKDB = importlib.util.find_spec("duckdb") is not None
+
+SUMMARY_COLUMNS = ["State", "Start_Time", "Temperature(F)"]
+POINT_COLUMNS = SUMMARY_COLUMNS + ["City", "Start_Lat", "Start_Lng"]
+
+
+class AccidentQuery:
+    """Common interface; ``states`` and the ``*_min``/``*_max`` bounds describe the data."""
+
+    name = "base"
+
+    def __init__(self, manifest):
+        self.fingerprint = manifest["fingerprint"]
+        self.revision = manifest["revision"]
+        self.domain_revision = manifest["domain_revision"]
+        # "State/year" -> revision of the last append that wrote into it.
+        self.partitions = manifest["partitions"]
+        self.partitioned = manifest.get("layout") == "partitioned"
+        self.parquet = Path(manifest["parquet"])
+        # Aggregates of this revision; appends stage theirs in a new directory.
+        self.aggregates = manifest.get("aggregates")
+        domain = manifest.get("domain", {})
+        self.states = domain.get("states", [])
+        self.temp_min = domain.get("temp_min")
+        self.temp_max = domain.get("temp_max")
+        self.time_min = pd.Timestamp(domain["time_min"]) if domain.get("time_min") else None
+        self.time_max = pd.Timestamp(domain["time_max"]) if domain.get("time_max") else None
+
+    @property
+    def histogram_edges(self):
+        """Fixed temperature bin edges shared by every selection."""
+        return histogram_edges(self.temp_min, self.temp_max)
+
+    def version(self, states, date_range=None):
+        """Data version of a selection, for cache keys.
+
+        An append changes it only for selections that include a partition
+        the append wrote to, or for every selection when it widened the
+        temperature bounds (the histogram bins depend on them).
+        """
+        years = None if date_range is None else range(date_range[0].year, date_range[1].year + 1)
+        selected = set(states)
+        touched = 0
+        for key, revision in self.partitions.items():
+            state, year = key.rsplit("/", 1)
+            if state in selected and (years is None or (year != "null" and int(year) in years)):
+                touched = max(touched, revision)
+        return f"{self.fingerprint}.d{self.domain_revision}.p{touched}"
+
+    @cached_property
+    def _daily_cells(self):
+        if not self.partitioned:
+            return None
+        from utils.ingest import AGGREGATES_DIR
+
+        return pd.read_parquet(self.parquet / (self.aggregates or AGGREGATES_DIR) / "daily_cells.parquet")
+
+    def _stored_cells(self, states, temp_range=None, date_range=None):
+        # The ingest keeps (State, day, has temperature) cells up to date on
+        # every append; they answer any selection that cuts no temperatures.
+        cells = self._daily_cells
+        if cells is None:
+            return None
+        keep = cells["State"].isin(list(states)).to_numpy()
+        if temp_range is not None:
+            lo, hi = stored_temp_range(temp_range)
+            if self.temp_min is None or lo > self.temp_min or hi < self.temp_max:
+                return None
+            keep = keep & cells["has_temp"].to_numpy()
+        day = cells["day"].to_numpy()
+        if date_range is not None:
+            start, end = (np.datetime64(d, "D").astype(np.int64) for d in date_range)
+            keep = keep & (day != _NAT) & (day >= start) & (day <= end)
+        cells = cells[keep]
+        state = pd.Categorical(cells["State"], categories=sorted(cells["State"].unique()))
+        return (
+            list(state.categories),
+            np.asarray(state.codes, dtype=np.int64),
+            day[keep],
+            cells["count"].to_numpy(np.int64),
+            cells["temp_sum"].to_numpy(np.float64),
+            cells["temp_count"].to_numpy(np.int64),
+            cells["max_time"].to_numpy(np.int64),
+        )
+
+    def _cell_arrays(self, states, temp_range=None, date_range=None):
+        """``summarize`` inputs (categories, then per-cell arrays) for the matching rows."""
+        raise NotImplementedError
+
+    def summary(self, states, temp_range=None, date_range=None):
+        """KPIs, per-state counts and daily series as a ``CubeResult``."""
+        return summarize(*self._cell_arrays(states, temp_range, date_range))
+
+    def daily_cells(self, states, temp_range=None, date_range=None):
+        """Per (State, day) counts and temperature sums of the matching rows (``group_cells``)."""
+        return group_cells(*self._cell_arrays(states, temp_range, date_range))
+
+    def temperatures(self, states, temp_range=None):
+        """Non-null temperatures of the matching rows."""
+        raise NotImplementedError
+
+    def histogram(self, states, temp_range=None):
+        """Accident counts per ``histogram_edges`` bin."""
+        return bin_counts(self.temperatures(states, temp_range), self.histogram_edges)
+
+    def geo(self, states, temp_range=None):
+        """Grid-aggregated locations as a ``GeoResult``."""
+        raise NotImplementedError
+
+    def points(self, states, temp_range=None):
+        """Located matching rows with ``POINT_COLUMNS`` (only for small selections)."""
+        raise NotImplementedError
+
+    def scan_stats(self, states, temp_range=None, date_range=None):
+        """Files / row groups read for the selection, or None when nothing is scanned."""
+        return None
+
+
+class InMemoryQuery(AccidentQuery):
+    name = "memory"
+
+    def __init__(self, manifest, csv_path=CSV_PATH):
+        super().__init__(manifest)
+        self.csv_path = csv_path
+        self.index = load_filter_index(csv_path)
+        # The index is authoritative for the bounds of the in-memory data.
+        self.states = self.index.states
+        self.temp_min, self.temp_max = self.index.temp_min, self.index.temp_max
+        self.time_min, self.time_max = self.index.time_min, self.index.time_max
+
+    def summary(self, states, temp_range=None, date_range=None):
+        return load_cube(self.csv_path).query(states, temp_range, date_range)
+
+    def daily_cells(self, states, temp_range=None, date_range=None):
+        return load_cube(self.csv_path).cells(states, temp_range, date_range)
+
+    def temperatures(self, states, temp_range=None):
+        rows = self.index.select(states, temp_range)
+        temps = column_array("Temperature(F)", self.csv_path)[rows]
+        return temps[~np.isnan(temps)]
+
+    @property
+    def histogram_edges(self):
+        return load_histogram(self.csv_path).edges
+
+    def histogram(self, states, temp_range=None):
+        return load_histogram(self.csv_path).query(states, temp_range)
+
+    def geo(self, states, temp_range=None):
+        return load_geo_pyramid(self.csv_path).query(states, temp_range)
+
+    def points(self, states, temp_range=None):
+        rows = load_geo_pyramid(self.csv_path).points(states, temp_range)
+        return load_accidents(POINT_COLUMNS, self.csv_path).iloc[rows]
+
+
+class PartitionedQuery(AccidentQuery):
+    name = "partitioned"
+
+    def __init__(self, manifest, csv_path=CSV_PATH):
+        super().__init__(manifest)
+        from utils.store import load_store  # pyarrow.dataset, only needed here
+
+        self.store = load_store(csv_path)
+
+    def _scan(self, columns, states, temp_range=None, date_range=None):
+        # Scans are memoized in the shared LRU so one selection is read once.
+        key = ("scan", self.version(states, date_range), tuple(columns), filter_key(states, temp_range, date_range))
+
+        def read():
+            with stage("scan") as timing:
+                df = self.store.scan(columns, states, temp_range, date_range)
+                timing["rows"] = len(df)
+            return df, dict(self.store.last_scan)
+
+        return get_chart_cache().get_or_compute(key, read)
+
+    def _cell_arrays(self, states, temp_range=None, date_range=None):
+        arrays = self._stored_cells(states, temp_range, date_range)
+        if arrays is not None:
+            return arrays
+        df, _ = self._scan(SUMMARY_COLUMNS, states, temp_range, date_range)
+        return row_cells(df["State"], df["Start_Time"], df["Temperature(F)"])
+
+    def temperatures(self, states, temp_range=None):
+        df, _ = self._scan(SUMMARY_COLUMNS, states, temp_range)
+        return df["Temperature(F)"].dropna().to_numpy()
+
+    def _located(self, states, temp_range):
+        df, _ = self._scan(POINT_COLUMNS, states, temp_range)
+        return df[df["Start_Lat"].notna() & df["Start_Lng"].notna() & df["Temperature(F)"].notna()]
+
+    def geo(self, states, temp_range=None):
+        df = self._located(states, temp_range)
+        return bin_points(df["Start_Lat"], df["Start_Lng"], df["Temperature(F)"])
+
+    def points(self, states, temp_range=None):
+        return self._located(states, temp_range)
+
+    def scan_stats(self, states, temp_range=None, date_range=None):
+        return self._scan(SUMMARY_COLUMNS, states, temp_range, date_range)[1]
+
+
+class DuckDBQuery(AccidentQuery):
+    name = "duckdb"
+
+    def __init__(self, manifest, csv_path=CSV_PATH):
+        if not HAS_DUCKDB:
+            raise ImportError("the duckdb backend needs `pip install duckdb`")
+        import duckdb
+
+        super().__init__(manifest)
+        # Only the files the manifest has published, not those of an append in progress.
+        files = dataset_files(manifest) if self.partitioned else [manifest["parquet"]]
+        SPILL_DIR.mkdir(parents=True, exist_ok=True)
+        self.con = duckdb.connect(config={"temp_directory": str(SPILL_DIR)})
+        paths = ", ".join(f"'{path}'" for path in files)
+        self.con.execute(
+            f"CREATE VIEW accidents AS SELECT * FROM read_parquet([{paths}], "
+            f"hive_partitioning = {str(self.partitioned).lower()})"
+        )
+        self.source = "accidents"
+        self._local = threading.local()
+
+    def _cursor(self):
+        # One cursor per thread: Streamlit runs each session in its own thread.
+        if not hasattr(self._local, "cursor"):
+            self._local.cursor = self.con.cursor()
+        return self._local.cursor
+
+    def _where(self, states, temp_range=None, date_range=None):
+        # Same semantics as FilterIndex.select: inclusive bounds, nulls dropped.
+        clauses, params = ["list_contains(?, State)"], [list(states)]
+        if temp_range is not None:
+            clauses.append('"Temperature(F)" BETWEEN ? AND ?')
+            params += list(stored_temp_range(temp_range))
+        if date_range is not None:
+            clauses.append("CAST(Start_Time AS DATE) BETWEEN ? AND ?")
+            params += list(date_range)
+            if self.partitioned:
+                clauses.append("year BETWEEN ? AND ?")
+                params += [date_range[0].year, date_range[1].year]
+        return " AND ".join(clauses), params
+
+    def _fetch(self, sql, params):
+        return self._cursor().execute(sql, params).df()
+
+    def _cell_arrays(self, states, temp_range=None, date_range=None):
+        arrays = self._stored_cells(states, temp_range, date_range)
+        if arrays is not None:
+            return arrays
+        where, params = self._where(states, temp_range, date_range)
+        cells = self._fetch(f"""
+            SELECT State AS state,
+                   CAST(Start_Time AS DATE) - DATE '1970-01-01' AS day,
+                   count(*) AS count,
+                   coalesce(sum("Temperature(F)"), 0) AS temp_sum,
+                   count("Temperature(F)") AS temp_count,
+                   epoch_ns(max(Start_Time)) AS max_time
+            FROM {self.source}
+            WHERE {where}
+            GROUP BY ALL
+        """, params)
+        state = pd.Categorical(cells["state"], categories=sorted(cells["state"].unique()))
+        return (
+            list(state.categories),
+            np.asarray(state.codes, dtype=np.int64),
+            cells["day"].fillna(_NAT).to_numpy(np.int64),
+            cells["count"].to_numpy(np.int64),
+            cells["temp_sum"].to_numpy(np.float64),
+            cells["temp_count"].to_numpy(np.int64),
+            cells["max_time"].fillna(_NAT).to_numpy(np.int64),
+        )
+
+    def temperatures(self, states, temp_range=None):
+        where, params = self._where(states, temp_range)
+        return self._fetch(
+            f'SELECT "Temperature(F)" AS t FROM {self.source} WHERE {where} AND "Temperature(F)" IS NOT NULL',
+            params,
+        )["t"].to_numpy()
+
+    def histogram(self, states, temp_range=None):
+        # Temperatures are reported to 0.1 °F: binning the distinct values
+        # (weighted by their counts) ships a few thousand rows at most.
+        where, params = self._where(states, temp_range)
+        values = self._fetch(
+            f'SELECT "Temperature(F)" AS t, count(*) AS n FROM {self.source} WHERE {where} GROUP BY 1', params
+        )
+        return bin_counts(values["t"], self.histogram_edges, weights=values["n"])
+
+    def _located(self, states, temp_range, columns):
+        where, params = self._where(states, temp_range)
+        select = ", ".join(f'"{col}"' for col in columns)
+        return self._fetch(f"""
+            SELECT {select} FROM {self.source}
+            WHERE {where} AND Start_Lat IS NOT NULL AND Start_Lng IS NOT NULL
+              AND "Temperature(F)" IS NOT NULL
+        """, params)
+
+    def geo(self, states, temp_range=None):
+        df = self._located(states, temp_range, ["Start_Lat", "Start_Lng", "Temperature(F)"])
+        return bin_points(df["Start_Lat"], df["Start_Lng"], df["Temperature(F)"])
+
+    def points(self, states, temp_range=None):
+        return self._located(states, temp_range, POINT_COLUMNS)
+
+
+def _backend(manifest, backend):
+    if backend == "duckdb" or (backend == "auto" and HAS_DUCKDB and manifest.get("layout") == "partitioned"):
+        return DuckDBQuery
+    if manifest.get("layout") == "partitioned":
+        return PartitionedQuery
+    return InMemoryQuery
+
+
+@tracked_cache("open_query", st.cache_resource(max_entries=4))
+def _open_query(csv_path, version, backend):
+    manifest = load_manifest(csv_path)
+    return _backend(manifest, backend)(manifest, csv_path)
+
+
+def load_query(csv_path=CSV_PATH, backend=None):
+    """Return the query backend for the current dataset version."""
+    return _open_query(str(csv_path), data_version(load_manifest(csv_path)), backend or QUERY_BACKEND)
+
+
+def _same(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return a is not None and b is not None and math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-6)
+    return a == b
+
+
+def check_parity(left, right, selections):
+    """Compare two backends on ``(states, temp_range, date_range)`` selections.
+
+    Returns a list of human-readable mismatches (empty when they agree).
+    """
+    problems = []
+    for states, temp_range, date_range in selections:
+        label = f"{left.name} vs {right.name} {list(states)[:3]}.. {temp_range} {date_range}"
+        a = left.summary(states, temp_range, date_range)
+        b = right.summary(states, temp_range, date_range)
+        for field in ("total", "temp_count", "latest", "temp_mean"):
+            if not _same(getattr(a, field), getattr(b, field)):
+                problems.append(f"{label}: {field} {getattr(a, field)!r} != {getattr(b, field)!r}")
+        for field, frame in (("by_state", a.by_state), ("daily", a.daily)):
+            try:
+                pd.testing.assert_frame_equal(frame, getattr(b, field), check_dtype=False, rtol=1e-6)
+            except AssertionError as exc:
+                problems.append(f"{label}: {field} differs ({str(exc).splitlines()[0]})")
+
+        ca = left.daily_cells(states, temp_range, date_range)
+        cb = right.daily_cells(states, temp_range, date_range)
+        try:
+            pd.testing.assert_frame_equal(
+                ca.astype({"State": str}), cb.astype({"State": str}), check_dtype=False, rtol=1e-6
+            )
+        except AssertionError as exc:
+            problems.append(f"{label}: daily_cells differ ({str(exc).splitlines()[0]})")
+
+        ha, hb = left.histogram(states, temp_range), right.histogram(states, temp_range)
+        if not np.array_equal(ha, hb):
+            problems.append(f"{label}: histogram differs ({ha.sum()} vs {hb.sum()} counted)")
+
+        ta = np.sort(left.temperatures(states, temp_range))
+        tb = np.sort(right.temperatures(states, temp_range))
+        if len(ta) != len(tb) or not np.allclose(ta, tb):
+            problems.append(f"{label}: temperatures differ ({len(ta)} vs {len(tb)} values)")
+
+        ga, gb = left.geo(states, temp_range), right.geo(states, temp_range)
+        cells = ["Lat", "Lng"]
+        if ga.n_points != gb.n_points or ga.cell_size != gb.cell_size or not ga.cells.sort_values(cells, ignore_index=True).round(6).equals(
+            gb.cells.sort_values(cells, ignore_index=True).round(6)
+        ):
+            problems.append(f"{label}: geo differs ({ga.n_points} vs {gb.n_points} points)")
+    return problems
+
+
+def default_selections(query):
+    """A few selections covering all states, a subset, and temperature/date cuts."""
+    states = query.states
+    mid = (query.temp_min + query.temp_max) / 2 if query.temp_min is not None else 0
+    dates = None
+    if query.time_min is not None:
+        dates = (query.time_min.date(), date(query.time_min.year, 12, 31))
+    return [
+        (states, None, None),
+        (states[:5], None, None),
+        (states[:2], (query.temp_min, mid + 0.5), None),
+        (states[:5], (mid - 10.25, mid + 10.25), dates),
+        (states[:5], (query.temp_min, query.temp_max), dates),
+        ([], None, None),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare query backends on the current dataset.")
+    parser.add_argument("--parity", action="store_true", help="check every available backend against pandas")
+    parser.add_argument("--csv", default=str(CSV_PATH))
+    args = parser.parse_args(argv)
+    if not args.parity:
+        parser.print_help()
+        return 0
+
+    manifest = load_manifest(args.csv)
+    reference = _backend(manifest, "pandas")(manifest, args.csv)
+    others = [DuckDBQuery(manifest, args.csv)] if HAS_DUCKDB else []
+    if manifest.get("layout") != "partitioned":
+        # The in-memory engines and a scan of the same file must agree too.
+        others.append(PartitionedQuery(manifest, args.csv))
+    problems = [p for other in others for p in check_parity(reference, other, default_selections(reference))]
+    for problem in problems:
+        print(problem)
+    print(f"{reference.name} vs {', '.join(o.name for o in others) or 'nothing'}: {len(problems)} mismatches")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+# utils/shared.py
+"""Memory-mapped columns shared by every server process on a node.
+
+``publish_columns`` writes each column of the compact frame as raw ``.npy``
+buffers next to the Parquet file (categoricals as codes + categories,
+nullable numbers as values + mask). ``attach_column`` maps them read-only and
+wraps them in a pandas Series without copying, so every Streamlit worker
+reads the same pages of the OS page cache instead of parsing its own copy.
+Columns without a fixed-width layout (free text) are not published and are
+read from Parquet as before.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+LAYOUT_FILE = "columns.json"
+
+
+def shared_dir(parquet_path):
+    """Directory holding the mapped columns of ``parquet_path``."""
+    return Path(parquet_path).with_suffix(".columns")
+
+
+def _save(path, array):
+    # Write-then-rename, so a worker never maps a half-written file.
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp, path)
+
+
+def _buffers(series):
+    """``(kind, {suffix: array}, extra)`` for one column, or None if it can't be mapped."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories
+        if categories.dtype != object and not pd.api.types.is_string_dtype(categories.dtype):
+            return None
+        return "category", {"codes": series.cat.codes.to_numpy()}, {"categories": [str(c) for c in categories]}
+    if isinstance(series.array, pd.arrays.BooleanArray | pd.arrays.IntegerArray | pd.arrays.FloatingArray):
+        values = series.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        return "masked", {"values": values, "mask": series.isna().to_numpy()}, {"dtype": str(dtype)}
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufM":
+        return "numpy", {"values": series.to_numpy()}, {}
+    return None
+
+
+def publish_columns(df, directory):
+    """Write the mappable columns of ``df`` into ``directory``; return the column layout."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    layout = {}
+    for i, column in enumerate(df.columns):
+        found = _buffers(df[column])
+        if found is None:
+            continue
+        kind, arrays, extra = found
+        stem = f"{i:03d}"
+        for suffix, array in arrays.items():
+            _save(directory / f"{stem}.{suffix}.npy", array)
+        layout[column] = {"kind": kind, "stem": stem, **extra}
+    tmp = directory / f"{LAYOUT_FILE}.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(layout, indent=2))
+    os.replace(tmp, directory / LAYOUT_FILE)
+    return layout
+
+
+def load_layout(directory):
+    """Column layout written by ``publish_columns`` ({} if nothing was published)."""
+    try:
+        return json.loads((Path(directory) / LAYOUT_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def attach_column(directory, column, spec):
+    """Zero-copy, read-only Series over the mapped buffers of ``column``."""
+    directory = Path(directory)
+
+    def mapped(suffix):
+        return np.load(directory / f"{spec['stem']}.{suffix}.npy", mmap_mode="r")
+
+    if spec["kind"] == "category":
+        dtype = pd.CategoricalDtype(spec["categories"])
+        values = pd.Categorical.from_codes(mapped("codes"), dtype=dtype, validate=False)
+    elif spec["kind"] == "masked":
+        array_type = pd.api.types.pandas_dtype(spec["dtype"]).construct_array_type()
+        values = array_type(mapped("values"), mapped("mask"), copy=False)
+    else:
+        values = mapped("values")
+    return pd.Series(values, name=column, copy=False)
@@ -0,0 +1,249 @@
+# utils/snapshots.py
+"""Static PNG/SVG snapshots of the Gallery and Dashboard charts.
+
+``python -m utils.snapshots`` pre-renders every chart of both pages for
+their default filters with kaleido. The figures are built here with the same
+``utils.charts`` calls the pages make and then rendered in a process pool,
+one kaleido/Chromium per worker. Files are named by the chart's cache key,
+which contains the data version of the selection, so an ingest or an append
+that touches the selection makes its snapshots miss instead of going stale::
+
+    python -m utils.snapshots                                  # default views
+    python -m utils.snapshots --filters sets.json --out export/  # bulk export
+
+The pages put a snapshot (``snapshot_slot``) where each chart goes, so a
+first visit paints a static image while the interactive figure is computed,
+and ``show_chart`` replaces it. Reading snapshots needs nothing beyond the
+file; only rendering needs the optional ``kaleido``.
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import streamlit as st
+
+from utils.data import CACHE_DIR, CSV_PATH, load_manifest
+from utils.memo import selection_key
+from utils.parallel import WORKERS
+
+SNAPSHOT_DIR = CACHE_DIR / "snapshots"
+FORMATS = ("png", "svg")
+IMAGE_WIDTH = 1000
+IMAGE_HEIGHT = 500
+# Optional; imported only by the render workers.
+HAS_KALEIDO = importlib.util.find_spec("kaleido") is not None
+
+PAGES = {
+    "gallery": ["gallery_bar", "gallery_hist", "gallery_map", "gallery_time"],
+    "dashboard": ["dashboard_state_bar", "dashboard_temp_line"],
+}
+
+
+# -----------------------------------------------------------
+# Snapshot files
+# -----------------------------------------------------------
+def _snapshot_dir(csv_path=CSV_PATH):
+    return SNAPSHOT_DIR / Path(csv_path).stem / load_manifest(csv_path)["fingerprint"]
+
+
+def snapshot_path(chart, key, fmt="png", csv_path=CSV_PATH):
+    """Where the snapshot of ``chart`` for the selection ``key`` lives."""
+    digest = hashlib.sha1(repr((chart, key)).encode()).hexdigest()[:20]
+    return _snapshot_dir(csv_path) / f"{chart}-{digest}.{fmt}"
+
+
+def snapshot_slot(chart, key, cache, csv_path=CSV_PATH):
+    """Placeholder for a chart, showing its snapshot if the figure still has to be computed."""
+    slot = st.empty()
+    if (chart, key) not in cache:
+        # Whichever format was rendered (``--format``), PNG first.
+        path = next(
+            (p for p in (snapshot_path(chart, key, fmt, csv_path) for fmt in FORMATS) if p.exists()), None
+        )
+        if path is not None:
+            try:
+                slot.image(str(path), width="stretch")
+            except Exception:  # an unreadable snapshot only costs the early paint
+                slot.empty()
+    return slot
+
+
+# -----------------------------------------------------------
+# Figures per page
+# -----------------------------------------------------------
+def default_selection(query, page):
+    """The selection a page shows before any filter is touched."""
+    selection = {
+        "page": page,
+        "states": query.states[:5],
+        "temp_range": (query.temp_min if query.temp_min is not None else 0,
+                       query.temp_max if query.temp_max is not None else 100),
+        "date_range": None,
+    }
+    if page == "dashboard" and query.time_min is not None:
+        selection["date_range"] = (query.time_min.date(), query.time_max.date())
+    return selection
+
+
+def page_figures(query, selection):
+    """``[(chart, key, payload)]`` for every chart ``selection`` draws on its page."""
+    from utils.charts import (
+        accidents_over_time_chart, location_map_chart, state_counts_chart, temperature_histogram_chart,
+        temperature_over_time_chart,
+    )
+
+    states, temp_range, date_range = selection["states"], selection["temp_range"], selection["date_range"]
+    key = selection_key(query, states, temp_range, date_range)
+    if selection["page"] == "gallery":
+        summary = query.summary(states, temp_range)
+        payloads = {
+            "gallery_bar": state_counts_chart(summary, horizontal=True),
+            "gallery_hist": temperature_histogram_chart(query, states, temp_range),
+            "gallery_map": location_map_chart(query, states, temp_range)[0],
+            "gallery_time": accidents_over_time_chart(summary)[0],
+        }
+    else:
+        summary = query.summary(states, temp_range, date_range)
+        payloads = {}
+        if summary.total > 0:
+            payloads["dashboard_state_bar"] = state_counts_chart(summary)
+            payloads["dashboard_temp_line"] = temperature_over_time_chart(summary)
+    return [(chart, key, payload) for chart, payload in payloads.items() if payload is not None]
+
+
+def read_selections(path, query):
+    """Selections from a JSON list of ``{"page", "states", "temp_range", "date_range"}`` objects.
+
+    Missing fields take the page's defaults; dates are ISO strings.
+    """
+    selections = []
+    for item in json.loads(Path(path).read_text()):
+        page = item.get("page", "dashboard")
+        if page not in PAGES:
+            raise ValueError(f"unknown page {page!r} (expected one of {', '.join(PAGES)})")
+        selection = default_selection(query, page)
+        if "states" in item:
+            selection["states"] = list(item["states"])
+        if "temp_range" in item:
+            selection["temp_range"] = tuple(float(t) for t in item["temp_range"])
+        if "date_range" in item:
+            dates = item["date_range"]
+            selection["date_range"] = None if dates is None else tuple(date.fromisoformat(d) for d in dates)
+        selections.append(selection)
+    return selections
+
+
+# -----------------------------------------------------------
+# Rendering
+# -----------------------------------------------------------
+def _render(spec, base, formats, width, height):
+    # Runs in a worker process; one kaleido renderer per process.
+    import plotly.io as pio
+
+    fig = pio.from_json(spec, skip_invalid=True)
+    written = []
+    for fmt in formats:
+        path = Path(f"{base}.{fmt}")
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(pio.to_image(fig, format=fmt, width=width, height=height, validate=False))
+        os.replace(tmp, path)  # a page never shows a half-written image
+        written.append(str(path))
+    return written
+
+
+def render_selections(query, selections, formats=FORMATS, csv_path=CSV_PATH, workers=WORKERS):
+    """Render every chart of ``selections`` into the snapshot directory.
+
+    Returns ``(rendered, failures)``: per selection the list of
+    ``(chart, paths)``, and ``(chart, error)`` for charts that failed.
+    """
+    if not HAS_KALEIDO:
+        raise ImportError("rendering snapshots needs `pip install kaleido`")
+
+    out_dir = _snapshot_dir(csv_path)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Snapshots of earlier source files can never match again.
+    for stale in out_dir.parent.iterdir():
+        if stale != out_dir and stale.is_dir():
+            shutil.rmtree(stale, ignore_errors=True)
+
+    tasks = []
+    for index, selection in enumerate(selections):
+        for chart, key, payload in page_figures(query, selection):
+            base = snapshot_path(chart, key, "png", csv_path).with_suffix("")
+            tasks.append((index, chart, payload.spec, base))
+
+    rendered, failures = [[] for _ in selections], []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks)))) as pool:
+        futures = [
+            (index, chart, pool.submit(_render, spec, base, formats, IMAGE_WIDTH, IMAGE_HEIGHT))
+            for index, chart, spec, base in tasks
+        ]
+        for index, chart, future in futures:
+            try:
+                rendered[index].append((chart, future.result()))
+            except Exception as e:  # e.g. map tiles unreachable; the page falls back to the live figure
+                message = next((line for line in str(e).splitlines() if line.strip()), "")
+                failures.append((chart, f"{type(e).__name__}: {message}"))
+    return rendered, failures
+
+
+def export(rendered, selections, out):
+    """Copy rendered snapshots to ``out/<n>-<page>/<chart>.<fmt>`` with an ``index.json``."""
+    out = Path(out)
+    index = []
+    for n, (selection, charts) in enumerate(zip(selections, rendered), 1):
+        folder = out / f"{n:03d}-{selection['page']}"
+        folder.mkdir(parents=True, exist_ok=True)
+        files = []
+        for chart, paths in charts:
+            for path in paths:
+                target = folder / f"{chart}{Path(path).suffix}"
+                shutil.copyfile(path, target)
+                files.append(str(target.relative_to(out)))
+        index.append({**selection, "files": files})
+    (out / "index.json").write_text(json.dumps(index, indent=2, default=str))
+    return out / "index.json"
+
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render the Gallery and Dashboard charts to static images.")
+    parser.add_argument("--csv", default=str(CSV_PATH))
+    parser.add_argument("--filters", help="JSON list of selections to render in addition to the default views")
+    parser.add_argument("--no-defaults", action="store_true", help="render only the --filters selections")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--out", help="also copy the rendered files into this directory, one folder per selection")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args(argv)
+    if not HAS_KALEIDO:
+        print("kaleido is not installed: pip install kaleido")
+        return 1
+
+    from utils.query import load_query
+
+    query = load_query(args.csv)
+    selections = [] if args.no_defaults else [default_selection(query, page) for page in PAGES]
+    if args.filters:
+        selections += read_selections(args.filters, query)
+
+    rendered, failures = render_selections(query, selections, args.format, args.csv, args.workers)
+    for chart, error in failures:
+        print(f"{chart}: {error}")
+    count = sum(len(paths) for charts in rendered for _, paths in charts)
+    print(f"rendered {count} files for {len(selections)} selections into {_snapshot_dir(args.csv)}")
+    if args.out:
+        print(f"wrote {export(rendered, selections, args.out)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
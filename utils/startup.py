@@ -0,0 +1,70 @@
+# utils/startup.py
+"""Cold-start profile of the app's scripts.
+
+Each script runs once in a fresh interpreter through Streamlit's
+``AppTest`` (which already has Streamlit itself imported, like a running
+server). The report shows the first-run time and the heavy packages the
+script pulled in::
+
+    python -m utils.startup            # every page, cold
+    python -m utils.startup --warm     # analytics pages after utils.warmup
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPTS = ["app.py", *sorted(str(p) for p in Path("pages").glob("*.py"))]
+HEAVY_PACKAGES = ("numpy", "pandas", "pyarrow", "plotly", "duckdb")
+
+_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+script, warm = sys.argv[1], sys.argv[2] == "1"
+warm_seconds = None
+if warm:
+    from utils.warmup import warm_up
+    warm_seconds = warm_up()
+before = set(sys.modules)
+started = time.perf_counter()
+at = AppTest.from_file(script, default_timeout=300).run()
+seconds = time.perf_counter() - started
+loaded = sorted({m.split(".")[0] for m in set(sys.modules) - before} & set(sys.argv[3].split(",")))
+print(json.dumps({
+    "script": script, "seconds": round(seconds, 3), "warm_up_seconds": warm_seconds,
+    "loaded": loaded, "exceptions": len(at.exception),
+}))
+"""
+
+
+def profile_script(script, warm=False):
+    """Run ``script`` once in a fresh interpreter and return its profile dict."""
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE, script, "1" if warm else "0", ",".join(HEAVY_PACKAGES)],
+        capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": "."},
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start profile of app.py and each page.")
+    parser.add_argument("scripts", nargs="*", default=SCRIPTS)
+    parser.add_argument("--warm", action="store_true", help="run utils.warmup before each script")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per script")
+    args = parser.parse_args(argv)
+
+    for script in args.scripts:
+        result = profile_script(script, args.warm)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            loaded = ", ".join(result["loaded"]) or "-"
+            print(f"{result['script']:<28} {result['seconds']:>7.2f}s  loads: {loaded}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,100 @@
+# utils/store.py
+"""Predicate pushdown over the columnar accidents files.
+
+``AccidentStore`` wraps the Parquet output of ``utils.data`` (one file) or
+``utils.ingest`` (a ``State=/year=`` dataset). A scan turns the sidebar
+selection into a dataset filter: partitions whose State or year cannot
+match are never opened, and row groups whose Start_Time / Temperature(F)
+statistics fall outside the range are skipped (chunks are written sorted by
+State and Start_Time, so row groups cover narrow time spans).
+"""
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+
+from utils.data import CSV_PATH, data_version, dataset_files, load_manifest, stored_temp_range
+
+
+class AccidentStore:
+    """Filtered, column-projected reads of the accidents dataset."""
+
+    def __init__(self, path, files=None):
+        # ``files`` restricts a partitioned dataset to the published ones.
+        self.dataset = ds.dataset(
+            files if files is not None else path, format="parquet",
+            partitioning=ds.HivePartitioning.discover(infer_dictionary=True),
+            partition_base_dir=None if files is None else str(path),
+        )
+        self.partitioned = "year" in self.dataset.schema.names
+        self._fragments_total = None
+        self._row_groups_total = None
+        self.last_scan = {}
+
+    def _timestamp(self, value):
+        return pa.scalar(pd.Timestamp(value), type=self.dataset.schema.field("Start_Time").type)
+
+    def _year_filter(self, start, end):
+        # Restated on the partition field so whole year directories are pruned.
+        return (ds.field("year") >= start.year) & (ds.field("year") <= end.year)
+
+    def filter(self, states=None, temp_range=None, date_range=None):
+        """Dataset expression with the same semantics as ``FilterIndex.select``."""
+        expr = ds.scalar(True)
+        if states is not None:
+            expr &= ds.field("State").isin(pa.array(list(states), type=pa.string()))
+        if temp_range is not None:
+            lo, hi = stored_temp_range(temp_range)
+            expr &= (ds.field("Temperature(F)") >= lo) & (ds.field("Temperature(F)") <= hi)
+        if date_range is not None:
+            start, end = date_range
+            expr &= (ds.field("Start_Time") >= self._timestamp(start)) & (
+                ds.field("Start_Time") < self._timestamp(end + timedelta(days=1))
+            )
+            if self.partitioned:
+                expr &= self._year_filter(start, end)
+        return expr
+
+    def _totals(self):
+        if self._fragments_total is None:
+            fragments = list(self.dataset.get_fragments())
+            self._fragments_total = len(fragments)
+            self._row_groups_total = sum(f.num_row_groups for f in fragments)
+        return self._fragments_total, self._row_groups_total
+
+    def scan(self, columns, states=None, temp_range=None, date_range=None):
+        """Read ``columns`` for the rows matching the selection into a DataFrame.
+
+        Scan statistics (files and row groups read versus total) are kept in
+        ``last_scan``.
+        """
+        expr = self.filter(states, temp_range, date_range)
+        fragments = list(self.dataset.get_fragments(filter=expr))
+        pieces = [rg for f in fragments for rg in f.split_by_row_group(filter=expr, schema=self.dataset.schema)]
+        table = ds.FileSystemDataset(
+            pieces, self.dataset.schema, self.dataset.format, self.dataset.filesystem
+        ).to_table(columns=list(columns), filter=expr, use_threads=True)
+
+        fragments_total, row_groups_total = self._totals()
+        self.last_scan = {
+            "files": len(fragments),
+            "files_total": fragments_total,
+            "row_groups": len(pieces),
+            "row_groups_total": row_groups_total,
+            "rows": table.num_rows,
+        }
+        return table.to_pandas()
+
+
+@st.cache_resource(max_entries=2)
+def _open_store(csv_path, version):
+    manifest = load_manifest(csv_path)
+    files = dataset_files(manifest) if manifest.get("layout") == "partitioned" else None
+    return AccidentStore(manifest["parquet"], files)
+
+
+def load_store(csv_path=CSV_PATH):
+    """Return the shared ``AccidentStore`` for the current dataset version."""
+    return _open_store(str(csv_path), data_version(load_manifest(csv_path)))
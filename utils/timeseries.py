@@ -0,0 +1,96 @@
+# utils/timeseries.py
+"""Bounded-size daily series for the line charts.
+
+A daily series is rolled up to weeks or months when the range holds more
+buckets than the chart can show, then thinned with Largest-Triangle-Three-
+Buckets (LTTB), which keeps the visually significant peaks and dips. Every
+trace therefore carries at most ``point_budget(width_px)`` points, however
+long the selected range is.
+"""
+import numpy as np
+import pandas as pd
+
+RESOLUTIONS = ("day", "week", "month")
+RESOLUTION_LABELS = {"day": "Daily", "week": "Weekly", "month": "Monthly"}
+CHART_WIDTH_PX = 700  # main column width of the default (centered) layout
+POINTS_PER_PX = 0.5
+LTTB_HEADROOM = 2  # a resolution may exceed the budget this much; LTTB trims the rest
+
+_MONDAY_OFFSET = 3  # 1970-01-01 was a Thursday
+
+
+def point_budget(width_px=CHART_WIDTH_PX):
+    return max(int(width_px * POINTS_PER_PX), 3)
+
+
+def rollup(daily, resolution):
+    """Sum a ``CubeResult.daily`` frame into ``resolution`` buckets.
+
+    Counts are summed; the mean temperature is re-weighted by ``Readings``.
+    """
+    if resolution == "day":
+        return daily
+    days = daily["Date"].to_numpy(dtype="datetime64[D]")
+    if resolution == "week":
+        day_numbers = days.astype(np.int64)
+        starts = (day_numbers + _MONDAY_OFFSET) // 7 * 7 - _MONDAY_OFFSET
+        buckets = starts.astype("datetime64[D]")
+    else:
+        buckets = days.astype("datetime64[M]").astype("datetime64[D]")
+
+    temps = daily["Temperature(F)"].to_numpy(dtype=np.float64)
+    readings = daily["Readings"].to_numpy(dtype=np.float64)
+    keys, inverse = np.unique(buckets, return_inverse=True)
+    accidents = np.bincount(inverse, weights=daily["Accidents"].to_numpy(), minlength=len(keys))
+    temp_sum = np.bincount(inverse, weights=np.nan_to_num(temps) * readings, minlength=len(keys))
+    temp_count = np.bincount(inverse, weights=readings, minlength=len(keys))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = temp_sum / temp_count
+    return pd.DataFrame({
+        "Date": keys.astype("datetime64[ns]"),
+        "Accidents": accidents.astype(np.int64),
+        "Temperature(F)": mean,
+        "Readings": temp_count.astype(np.int64),
+    })
+
+
+def choose_resolution(daily, width_px=CHART_WIDTH_PX):
+    """Finest resolution whose bucket count fits ``LTTB_HEADROOM`` x the point budget."""
+    if len(daily) == 0:
+        return "day"
+    first, last = daily["Date"].iloc[0], daily["Date"].iloc[-1]
+    days = (last - first).days + 1
+    limit = LTTB_HEADROOM * point_budget(width_px)
+    spans = {"day": days, "week": days / 7, "month": days / 30.4}
+    return next((r for r in RESOLUTIONS if spans[r] <= limit), "month")
+
+
+def lttb(x, y, n_out):
+    """Indices of the ``n_out`` points LTTB keeps from the series ``(x, y)``."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Interior points split into n_out - 2 buckets; first and last are kept.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # The next bucket's average (or the last point) is the third vertex.
+        nxt = slice(hi, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(daily, column, width_px=CHART_WIDTH_PX):
+    """Return ``(frame, resolution)`` with at most ``point_budget(width_px)`` rows of ``column``."""
+    resolution = choose_resolution(daily, width_px)
+    series = rollup(daily, resolution).dropna(subset=[column])
+    keep = lttb(series["Date"].to_numpy(dtype="datetime64[ns]").astype(np.int64), series[column], point_budget(width_px))
+    return series.iloc[keep].reset_index(drop=True), resolution
@@ -0,0 +1,54 @@
+# utils/warmup.py
+"""Background warm-up of the analytics pages.
+
+The landing page calls ``start_warm_up`` after it has drawn itself. A daemon
+thread then imports pandas/Plotly and builds the shared engines (manifest,
+filter index, cube, histogram, geo pyramid, and the Dashboard's sample when
+estimates are on) and the figure templates, so the first visit to the
+Gallery or Dashboard finds them in ``st.cache_resource``.
+This module imports nothing heavy itself; the Bio and Future Work pages stay
+free of pandas and Plotly.
+"""
+import logging
+import threading
+import time
+
+import streamlit as st
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def warm_up(csv_path=None):
+    """Build everything the first analytics page view needs; return the seconds taken."""
+    started = time.perf_counter()
+    from utils.data import CSV_PATH
+    from utils.approx import approx_default, sample_future
+    from utils.charts import state_counts_chart, temperature_histogram_chart
+    from utils.query import load_query
+
+    query = load_query(csv_path or CSV_PATH)
+    # The pages' default selection: first five states, full temperature range.
+    states = query.states[:5]
+    query.geo(states)
+    # The first go.Figure pays for loading Plotly's validators.
+    state_counts_chart(query.summary(states))
+    temperature_histogram_chart(query, states)
+    if approx_default(query, csv_path or CSV_PATH):
+        # The Dashboard's estimates need the stratified sample.
+        sample_future(csv_path or CSV_PATH).result()
+    return time.perf_counter() - started
+
+
+def _run(csv_path):
+    try:
+        _LOGGER.info("warm-up finished in %.2fs", warm_up(csv_path))
+    except Exception:  # never let a warm-up failure reach a page
+        _LOGGER.exception("warm-up failed")
+
+
+@st.cache_resource
+def start_warm_up(csv_path=None):
+    """Start the warm-up thread once per process (later calls are no-ops)."""
+    thread = threading.Thread(target=_run, args=(csv_path,), name="warm-up", daemon=True)
+    thread.start()
+    return thread